@@ -1,37 +1,76 @@
 import streamlit as st
 import pandas as pd
 import altair as alt  # Ensure Altair is imported
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import timedelta
 
+import price_store
+
 # Import functions from our modules.
-from optimizer import run_optimizers  
-from utils import dynamic_backtest_portfolio  
-from user_input import get_backtest_settings, get_asset_selection, get_optimization_methods
+from optimizer import OPTIMIZERS, efficient_frontier
+from optimizer_cache import OptimizerCache
+from profiling import stage_table
+from bootstrap import bootstrap_metrics, confidence_intervals
+from metrics import ROLLING_METRICS, rolling_metrics
+from universe import window_universe
+from utils import BacktestCancelled, bar_timedelta, dynamic_backtest_portfolios, periods_per_year, sweep_backtests
+from user_input import (
+    get_backtest_settings,
+    get_asset_selection,
+    get_optimization_methods,
+    get_sweep_settings,
+    get_trading_cost_settings,
+    get_bootstrap_settings,
+    get_rolling_metric_settings,
+    get_universe_settings
+)
 from plots import (
     plot_cumulative_returns, 
-    plot_rolling_sharpe, 
+    plot_rolling_metric,
     plot_drawdowns, 
     plot_allocations_per_method,
     plot_asset_returns, 
     plot_asset_prices,
-    pie_chart_allocation
+    pie_chart_allocation,
+    plot_sweep_heatmap,
+    plot_cumulative_costs,
+    plot_efficient_frontier
 )
 
 st.set_page_config(page_title="Crypto Portfolio Optimizer", layout="wide")
 st.title("🔀 Crypto Portfolio Optimizer (Dynamic HRB, MVO, EW)")
 
-# Load merged price data from Parquet.
+PRICES_PATH = "Data/prices.parquet"
+
+# Column list and date bounds from the price store's sidecar (no prices are loaded).
+@st.cache_data
+def load_metadata():
+    return price_store.load_metadata(PRICES_PATH)
+
+# Load only the selected coins and date range from Parquet.
 @st.cache_data
-def load_data():
-    return pd.read_parquet("Data/prices.parquet")
+def load_data(columns, start, end):
+    return price_store.load_prices(PRICES_PATH, columns=list(columns), start=start, end=end)
+
+# Persistent cache of per-window optimizer results, shared across sessions and restarts.
+@st.cache_resource
+def get_optimizer_cache():
+    return OptimizerCache("Data/optimizer_cache.sqlite")
 
-data = load_data()
-available_dates = data.index.sort_values()
+metadata = load_metadata()
+optimizer_cache = get_optimizer_cache()
+available_dates = pd.DatetimeIndex([metadata["start"], metadata["end"]])
 
 # Get user inputs from the sidebar.
-start_date, end_date, lookback_days, rebalance_days, nonnegative_toggle = get_backtest_settings(available_dates)
-selected_coins = get_asset_selection(data)
-data = data[selected_coins]
+start_date, end_date, lookback_days, rebalance_days, nonnegative_toggle, linkage_method, cov_method, halflife = get_backtest_settings(available_dates)
+top_n = get_universe_settings()
+# A dynamic universe picks its top N from every coin at each rebalance.
+selected_coins = list(metadata["columns"]) if top_n else get_asset_selection(metadata["columns"])
+drift, fee_bps, slippage_bps, no_trade_band = get_trading_cost_settings()
+trading_options = {"drift": drift, "fee_bps": fee_bps, "slippage_bps": slippage_bps, "no_trade_band": no_trade_band}
+# Include the lookback window before the start date used for the initial allocations.
+data = load_data(tuple(selected_coins), start_date - pd.Timedelta(days=lookback_days), end_date)
 
 # Define simulation data based on the selected dates.
 simulation_data = data.loc[start_date:end_date]
@@ -52,17 +91,122 @@ if plot_assets_button:
     st.altair_chart(plot_asset_prices(simulation_data, selected_coins, log_scale=(price_scale_option=="Log")), use_container_width=True)
     
 # ----- Dynamic Backtesting -----
+def cancel_backtest():
+    # Runs before the rerun the click triggers: stop the worker threads at their next rebalance
+    # date and don't restart the run. Methods that already finished stay memoized.
+    cancel_event = st.session_state.get("backtest_cancel")
+    if cancel_event is not None:
+        cancel_event.set()
+    st.session_state.pop("active_backtest_key", None)
+    st.session_state["backtest_cancelled"] = True
+
 st.markdown("## Dynamic Backtest Results")
 optimize_button = st.button("Optimize Portfolio")
 
+# Let the user select which optimization methods to include. This lives outside the button
+# block so changing the subset re-renders from the memoized results below.
+selected_methods = get_optimization_methods(OPTIMIZERS)
+n_bootstrap_paths, bootstrap_block, bootstrap_confidence = get_bootstrap_settings()
+rolling_windows_days = get_rolling_metric_settings()
+show_performance = st.sidebar.checkbox("Show Performance Panel", value=False)
+
+# Backtest results are memoized in the session, keyed by everything that changes them. Display
+# options and the method subset are not part of the key, so changing them reuses the results
+# and only methods that haven't been computed yet for this key are run.
+MAX_MEMOIZED_BACKTESTS = 5
+backtest_key = (
+    str(start_date), str(end_date), tuple(selected_coins), lookback_days, rebalance_days,
+    nonnegative_toggle, linkage_method, cov_method, halflife, drift, fee_bps, slippage_bps, no_trade_band, top_n,
+)
+memoized_backtests = st.session_state.setdefault("backtest_results", {})
 if optimize_button:
+    st.session_state["active_backtest_key"] = backtest_key
+    st.session_state.pop("backtest_cancelled", None)
+
+if st.session_state.get("active_backtest_key") == backtest_key:
     try:
-        # Compute initial allocations using the lookback window before the start date.
+        memo = memoized_backtests.setdefault(backtest_key, {"initial_allocations": {}, "results": {}, "profiles": []})
+        while len(memoized_backtests) > MAX_MEMOIZED_BACKTESTS:
+            memoized_backtests.pop(next(iter(memoized_backtests)))
+        missing_methods = [method for method in selected_methods if method not in memo["results"]]
+
+        # Lookback window before the start date (only the top N assets in it for a dynamic universe).
         lookback_window = data.loc[pd.to_datetime(start_date) - pd.Timedelta(days=lookback_days):start_date]
-        initial_allocations = run_optimizers(lookback_window, nonnegative_mvo=nonnegative_toggle)
+        if top_n:
+            lookback_window = lookback_window[window_universe(lookback_window, top_n)]
+
+        if missing_methods:
+            # Compute initial allocations using the lookback window before the start date. A
+            # dynamic universe has no assets to pick from a window of fewer than two rows (e.g. a
+            # backtest starting at the first available date); its initial allocations are then the
+            # backtest's first weights, filled in below.
+            if not top_n or (len(lookback_window) >= 2 and len(lookback_window.columns)):
+                memo["initial_allocations"].update(optimizer_cache.run_optimizers(
+                    lookback_window, methods=missing_methods, nonnegative_mvo=nonnegative_toggle,
+                    linkage_method=linkage_method, cov_method=cov_method, halflife=halflife
+                ))
 
-        # Let the user select which optimization methods to include.
-        selected_methods = get_optimization_methods(initial_allocations)
+            # Run the not-yet-computed methods concurrently on a thread pool, one backtest per
+            # method, so fast methods (Equal Weight, HRB) are shown while slow MVO solves continue.
+            # Worker threads only update the progress dict; all Streamlit calls stay on this thread.
+            cache_stats_before = optimizer_cache.stats()
+            cancel_event = threading.Event()
+            st.session_state["backtest_cancel"] = cancel_event
+            progress = {method: (0, 0) for method in missing_methods}
+
+            def run_method(method):
+                def report(done, total):
+                    progress[method] = (done, total)
+                return dynamic_backtest_portfolios(
+                    simulation_data, [method], lookback_days, rebalance_days, nonnegative_toggle,
+                    linkage_method=linkage_method, cov_method=cov_method, halflife=halflife, cache=optimizer_cache,
+                    profile=True, top_n=top_n, progress=report, cancel=cancel_event, **trading_options
+                )[method]
+
+            cancel_button = st.empty()
+            cancel_button.button("Cancel Backtest", on_click=cancel_backtest)
+            status = {method: st.empty() for method in missing_methods}
+            partial_chart = st.empty()
+            executor = ThreadPoolExecutor(max_workers=len(missing_methods), thread_name_prefix="backtest")
+            try:
+                pending = {executor.submit(run_method, method): method for method in missing_methods}
+                while pending:
+                    done, _ = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        method = pending.pop(future)
+                        result = future.result()
+                        memo["results"][method] = result
+                        if method not in memo["initial_allocations"]:
+                            memo["initial_allocations"][method] = result["allocations"].weights_at(0)
+                        memo["profiles"].append(([method], result["profile"]))
+                        status[method].write(
+                            f"✅ **{method}** finished in {result['profile']['total_seconds']:.1f}s: "
+                            f"Sharpe {result['sharpe']:.2f}, max drawdown {result['drawdown']:.2%}"
+                        )
+                        finished = {m: memo["results"][m] for m in missing_methods if m in memo["results"]}
+                        partial_chart.altair_chart(plot_cumulative_returns(finished), use_container_width=True)
+                    for method in pending.values():
+                        done_dates, total_dates = progress[method]
+                        status[method].progress(
+                            done_dates / total_dates if total_dates else 0.0,
+                            text=f"⏳ {method}: {done_dates}/{total_dates} rebalance dates"
+                        )
+            finally:
+                # Also reached when a rerun interrupts this script: stop the workers instead of
+                # letting them finish results nobody will collect.
+                cancel_event.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+            for placeholder in [cancel_button, *status.values(), partial_chart]:
+                placeholder.empty()
+            cache_stats = optimizer_cache.stats()
+            st.caption(
+                f"Optimizer cache: {cache_stats['hits'] - cache_stats_before['hits']} hits, "
+                f"{cache_stats['misses'] - cache_stats_before['misses']} misses this run "
+                f"({cache_stats['entries']} stored solves, {cache_stats['bytes'] / 1e6:.1f} MB)"
+            )
+
+        initial_allocations = memo["initial_allocations"]
+        results_dict = {method: memo["results"][method] for method in selected_methods}
 
         st.markdown("### Initial Allocations (Pie Charts)")
         pie_charts = []
@@ -71,37 +215,145 @@ if optimize_button:
             pie_charts.append(chart)
         st.altair_chart(alt.hconcat(*pie_charts), use_container_width=True)
 
+        # Efficient frontier of the initial lookback window, with the assets and initial portfolios.
+        window_returns = lookback_window.pct_change().dropna()
+        if "frontier" not in memo and len(window_returns) >= 2:
+            memo["frontier"] = efficient_frontier(lookback_window, n_points=30, nonnegative=nonnegative_toggle)
+        if "frontier" in memo:
+            st.markdown("### Efficient Frontier")
+            asset_stats = pd.DataFrame({"expected_return": window_returns.mean(), "volatility": window_returns.std()})
+            portfolio_returns = pd.DataFrame({
+                method: window_returns @ initial_allocations[method].reindex(window_returns.columns).fillna(0)
+                for method in selected_methods
+            })
+            portfolio_stats = pd.DataFrame({"expected_return": portfolio_returns.mean(), "volatility": portfolio_returns.std()})
+            st.altair_chart(plot_efficient_frontier(memo["frontier"], asset_stats, portfolio_stats), use_container_width=True)
+
         st.write(f"Backtest period: {pd.to_datetime(start_date).date()} to {pd.to_datetime(end_date).date()}")
         st.write(f"Rebalance Frequency: Every {rebalance_days} days")
-        st.write(f"Dynamic reoptimization uses the past {lookback_days} days of data with exponential weighting.")
-
-        # Run dynamic backtest for each selected optimization method.
-        results_dict = {}
-        for method in selected_methods:
-            res = dynamic_backtest_portfolio(simulation_data, method, lookback_days, rebalance_days, nonnegative_toggle)
-            results_dict[method] = res
+        if cov_method == "ewma":
+            st.write(f"Dynamic reoptimization uses exponentially weighted covariance with a {halflife}-day half-life.")
+        else:
+            st.write(f"Dynamic reoptimization uses the past {lookback_days} days of data.")
 
         st.markdown("### Cumulative Returns (starting at 0)")
         st.altair_chart(plot_cumulative_returns(results_dict), use_container_width=True)
 
-        st.markdown("### Rolling Annualized Sharpe Ratio")
-        st.altair_chart(plot_rolling_sharpe(results_dict), use_container_width=True)
+        # All rolling metrics for every method and window in one pass over the stacked returns.
+        method_returns = pd.DataFrame({method: res["returns"] for method, res in results_dict.items()})
+        bar = bar_timedelta(method_returns.index)
+        rolling_windows = sorted({max(int(round(pd.Timedelta(days=days) / bar)), 2) for days in rolling_windows_days})
+        metrics_frame = rolling_metrics(method_returns, rolling_windows, periods_per_year=periods_per_year(bar))
+
+        st.markdown("### Rolling Metrics")
+        metric_labels = {
+            "sharpe": "Sharpe Ratio", "sortino": "Sortino Ratio", "volatility": "Volatility",
+            "max_drawdown": "Maximum Drawdown (window)", "calmar": "Calmar Ratio",
+        }
+        rolling_metric = st.selectbox("Rolling Metric", ROLLING_METRICS, format_func=metric_labels.get)
+        st.altair_chart(plot_rolling_metric(metrics_frame, rolling_metric), use_container_width=True)
 
         st.markdown("### Rolling Maximum Drawdown")
         st.altair_chart(plot_drawdowns(results_dict), use_container_width=True)
 
+        if drift:
+            st.markdown("### Cumulative Trading Costs")
+            st.altair_chart(plot_cumulative_costs(results_dict), use_container_width=True)
+
         st.markdown("### Dynamic Asset Allocations Per Method")
         for method in selected_methods:
             st.altair_chart(plot_allocations_per_method(results_dict[method]["allocations"], method), use_container_width=True)
 
+        # Stationary block-bootstrap distributions, memoized per bootstrap setting. Every method
+        # is resampled with the same seed, so their paths line up.
+        bootstrap_memo = memo.setdefault("bootstrap", {}).setdefault((n_bootstrap_paths, bootstrap_block), {})
+        missing_bootstrap = [method for method in selected_methods if method not in bootstrap_memo]
+        if missing_bootstrap:
+            method_returns = pd.DataFrame({method: results_dict[method]["returns"] for method in missing_bootstrap})
+            if len(method_returns) >= 2:
+                with st.spinner(f"Resampling {n_bootstrap_paths} bootstrap paths..."):
+                    bootstrap_memo.update(bootstrap_metrics(
+                        method_returns, n_paths=n_bootstrap_paths, mean_block=bootstrap_block,
+                        periods_per_year=periods_per_year(bar_timedelta(method_returns.index))
+                    ))
+
         st.markdown("### Summary Metrics by Method")
+        level = f"{bootstrap_confidence:.0%}"
         for method, res in results_dict.items():
             st.subheader(method)
             st.write(f"**Final Annualized Sharpe Ratio:** {res['sharpe']:.2f}")
             st.write(f"**Maximum Drawdown:** {res['drawdown']:.2%}")
+            if method in bootstrap_memo:
+                ci = confidence_intervals(bootstrap_memo[method], bootstrap_confidence)
+                st.write(
+                    f"**Bootstrap {level} CI:** Sharpe [{ci.loc['sharpe', 'lower']:.2f}, {ci.loc['sharpe', 'upper']:.2f}], "
+                    f"Max Drawdown [{ci.loc['max_drawdown', 'lower']:.2%}, {ci.loc['max_drawdown', 'upper']:.2%}], "
+                    f"CVaR 5% [{ci.loc['cvar', 'lower']:.2%}, {ci.loc['cvar', 'upper']:.2%}]"
+                )
+            if "turnover" in res:
+                years = max((res["turnover"].index[-1] - res["turnover"].index[0]) / pd.Timedelta(days=365), 1 / 365)
+                st.write(f"**Annualized Turnover:** {res['turnover'].sum() / years:.2f}x")
+                st.write(f"**Total Trading Costs:** {res['costs'].sum():.2%} of portfolio value")
+
+        if show_performance:
+            st.markdown("### Performance")
+            for methods, profile in memo["profiles"]:
+                st.subheader(f"{', '.join(methods)}: {profile['total_seconds']:.2f}s")
+                st.dataframe(stage_table(profile), use_container_width=True)
+                solver = profile["solver"]
+                if solver["solves"]:
+                    statuses = ", ".join(f"{status}: {count}" for status, count in solver["status_counts"].items())
+                    st.write(
+                        f"**Solver:** {solver['solves']} solves ({statuses}), "
+                        f"{solver['mean_iterations']:.0f} iterations on average (max {solver['max_iterations']}), "
+                        f"{solver['solve_seconds']:.2f}s inside the solver"
+                    )
+                if profile["fallbacks"]:
+                    st.write("**Fallbacks to equal or previous weights:**")
+                    st.dataframe(pd.Series(profile["fallbacks"], name="count").rename_axis("reason"))
+                else:
+                    st.write("**Fallbacks to equal or previous weights:** none")
+                if len(profile["rebalances"]):
+                    st.caption("Time per rebalance (seconds)")
+                    st.line_chart(profile["rebalances"])
 
+    except BacktestCancelled:
+        st.info("Backtest cancelled.")
     except Exception as e:
         st.error("An error occurred during dynamic backtesting. Underlying asset plots are still displayed.")
         st.error(f"Error details: {e}")
+elif st.session_state.get("backtest_cancelled"):
+    st.info("Backtest cancelled. Finished methods are kept; click 'Optimize Portfolio' to run the rest.")
+elif "active_backtest_key" in st.session_state:
+    st.info("Backtest settings changed. Click the 'Optimize Portfolio' button to rerun the dynamic backtest.")
 else:
     st.info("Click the 'Optimize Portfolio' button to run the dynamic backtest and view optimization results.")
+
+# ----- Parameter Sweep -----
+st.markdown("## Parameter Sweep")
+lookback_grid, rebalance_grid, sweep_methods, nonnegative_grid = get_sweep_settings(list(OPTIMIZERS))
+sweep_button = st.button("Run Parameter Sweep")
+
+if sweep_button:
+    try:
+        with st.spinner(f"Running {len(lookback_grid) * len(rebalance_grid) * len(nonnegative_grid)} backtest configurations..."):
+            sweep_df = sweep_backtests(
+                simulation_data, lookback_grid, rebalance_grid, sweep_methods, nonnegative_grid,
+                linkage_method=linkage_method, cov_method=cov_method, halflife=halflife, top_n=top_n,
+                **trading_options
+            )
+
+        st.markdown("### Annualized Sharpe Ratio")
+        st.altair_chart(plot_sweep_heatmap(sweep_df, "sharpe"))
+
+        st.markdown("### Maximum Drawdown")
+        st.altair_chart(plot_sweep_heatmap(sweep_df, "max_drawdown"))
+
+        st.markdown("### Sweep Results")
+        st.dataframe(sweep_df.sort_values("sharpe", ascending=False), use_container_width=True)
+
+    except Exception as e:
+        st.error("An error occurred during the parameter sweep.")
+        st.error(f"Error details: {e}")
+else:
+    st.info("Click the 'Run Parameter Sweep' button to backtest every combination of the sweep settings.")
@@ -0,0 +1,216 @@
+# backtest_cli.py
+"""
+Headless batch runner for dynamic backtests, for nightly research jobs without Streamlit.
+
+Reads a YAML or JSON list of backtest specs, runs them in parallel on a process pool and
+writes each spec's cumulative returns, drawdowns and allocations (and turnover and costs when
+trading costs are simulated) to Parquet, plus a summary table of Sharpe and max drawdown for
+every spec and method.
+
+Example spec file (YAML):
+
+    - name: majors_hrp
+      coins: [BTC, ETH, SOL]
+      start: 2021-01-01
+      end: 2024-12-31
+      methods: [HRB, Equal Weight]
+      lookback_days: 90
+      rebalance_days: 30
+    - name: majors_hourly
+      coins: [BTC, ETH]
+      freq: 1h
+      lookback_days: 30D           # or a bar count, e.g. "720 bars"
+      rebalance_days: 6h
+      dtype: float32
+      fee_bps: 10                  # simulate drift, fees, slippage and a no-trade band
+      slippage_bps: 5
+      no_trade_band: 0.02
+    - name: top20_universe
+      top_n: 20                    # all coins, top 20 eligible per rebalance (sparse allocations)
+    - name: majors_mvo_ewma
+      coins: [BTC, ETH, SOL]
+      methods: [Mean Variance]
+      cov_method: ewma
+      halflife: 20
+
+Usage:
+    python backtest_cli.py specs.yaml --prices Data/prices.parquet --output-dir results --workers 4
+"""
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from price_store import load_metadata, load_prices
+from universe import dense_allocations
+from utils import dynamic_backtest_portfolios
+
+SPEC_DEFAULTS = {
+    "coins": None,
+    "start": None,
+    "end": None,
+    "methods": ["Equal Weight", "Mean Variance", "HRB"],
+    "lookback_days": 30,
+    "rebalance_days": 30,
+    "nonnegative": True,
+    "linkage_method": "single",
+    "cov_method": "sample",
+    "halflife": None,
+    "freq": None,
+    "dtype": "float64",
+    "drift": False,
+    "fee_bps": 0.0,
+    "slippage_bps": 0.0,
+    "no_trade_band": 0.0,
+    "top_n": None,
+}
+
+
+def load_specs(path):
+    """Read a list of backtest specs from a .yaml/.yml or .json file and fill in defaults."""
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError as e:
+                raise ImportError("Reading YAML specs requires PyYAML (pip install pyyaml); use a JSON file otherwise.") from e
+            specs = yaml.safe_load(f)
+        else:
+            specs = json.load(f)
+    if isinstance(specs, dict):
+        specs = [specs]
+
+    filled = []
+    for i, spec in enumerate(specs):
+        unknown = set(spec) - set(SPEC_DEFAULTS) - {"name"}
+        if unknown:
+            raise ValueError(f"Spec {i}: unknown keys {sorted(unknown)}")
+        spec = {**SPEC_DEFAULTS, "name": f"spec_{i}", **spec}
+        spec["name"] = str(spec["name"])
+        filled.append(spec)
+    names = [spec["name"] for spec in filled]
+    if len(set(names)) != len(names):
+        raise ValueError("Spec names must be unique.")
+    return filled
+
+
+def _period(value):
+    """Lookback/rebalance values are day/bar counts or period strings such as "6h" or "288 bars"."""
+    return value if isinstance(value, str) else int(value)
+
+
+def _safe_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def run_spec(spec, prices_path, output_dir):
+    """Run one spec in a worker process and write its Parquet outputs. Returns summary rows."""
+    started = time.perf_counter()
+    metadata = load_metadata(prices_path)
+    coins = spec["coins"] or metadata["columns"]
+    unknown = sorted(set(coins) - set(metadata["columns"]))
+    if unknown:
+        raise ValueError(f"Unknown coins in spec {spec['name']!r}: {unknown}")
+    prices = load_prices(prices_path, columns=coins, start=spec["start"], end=spec["end"])
+    if prices.empty:
+        raise ValueError(f"No price data for spec {spec['name']!r} in the selected period.")
+
+    results = dynamic_backtest_portfolios(
+        prices, spec["methods"], _period(spec["lookback_days"]), _period(spec["rebalance_days"]), bool(spec["nonnegative"]),
+        linkage_method=spec["linkage_method"], cov_method=spec["cov_method"], halflife=spec["halflife"],
+        freq=spec["freq"], dtype=np.dtype(spec["dtype"]).type, drift=bool(spec["drift"]), fee_bps=float(spec["fee_bps"]),
+        slippage_bps=float(spec["slippage_bps"]), no_trade_band=float(spec["no_trade_band"]),
+        top_n=None if spec["top_n"] is None else int(spec["top_n"]),
+    )
+
+    spec_dir = os.path.join(output_dir, _safe_name(spec["name"]))
+    os.makedirs(spec_dir, exist_ok=True)
+    pd.DataFrame({method: res["cumulative"] for method, res in results.items()}).to_parquet(
+        os.path.join(spec_dir, "cumulative.parquet"))
+    pd.DataFrame({method: res["drawdowns"] for method, res in results.items()}).to_parquet(
+        os.path.join(spec_dir, "drawdowns.parquet"))
+    pd.concat(
+        [dense_allocations(res["allocations"]).assign(method=method) for method, res in results.items()]
+    ).fillna(0.0).to_parquet(os.path.join(spec_dir, "allocations.parquet"))
+    if "turnover" in next(iter(results.values())):
+        pd.DataFrame({
+            **{f"{method} turnover": res["turnover"] for method, res in results.items()},
+            **{f"{method} costs": res["costs"] for method, res in results.items()},
+        }).to_parquet(os.path.join(spec_dir, "trading.parquet"))
+
+    elapsed = time.perf_counter() - started
+    return [
+        {
+            "name": spec["name"],
+            "method": method,
+            "sharpe": res["sharpe"],
+            "max_drawdown": res["drawdown"],
+            "start": str(prices.index.min()),
+            "end": str(prices.index.max()),
+            "n_assets": len(prices.columns),
+            "lookback_days": spec["lookback_days"],
+            "rebalance_days": spec["rebalance_days"],
+            "nonnegative": spec["nonnegative"],
+            "linkage_method": spec["linkage_method"],
+            "cov_method": spec["cov_method"],
+            "halflife": spec["halflife"],
+            "freq": spec["freq"],
+            "top_n": spec["top_n"],
+            "turnover": res["turnover"].sum() if "turnover" in res else None,
+            "costs": res["costs"].sum() if "costs" in res else None,
+            "seconds": elapsed,
+        }
+        for method, res in results.items()
+    ]
+
+
+def run_batch(specs, prices_path="Data/prices.parquet", output_dir="results", max_workers=None):
+    """Run every spec on a process pool and write summary.parquet to output_dir."""
+    os.makedirs(output_dir, exist_ok=True)
+    rows = []
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_spec, spec, prices_path, output_dir): spec["name"] for spec in specs}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                spec_rows = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"❌ {name}: {e}")
+                continue
+            rows.extend(spec_rows)
+            summary = ", ".join(f"{row['method']} Sharpe {row['sharpe']:.2f}" for row in spec_rows)
+            print(f"✅ {name} ({spec_rows[0]['seconds']:.1f}s): {summary}")
+
+    summary = pd.DataFrame(rows)
+    for column in ("lookback_days", "rebalance_days"):
+        # Day/bar counts and period strings can't share a Parquet column.
+        if column in summary and summary[column].map(type).nunique() > 1:
+            summary[column] = summary[column].astype(str)
+    summary.to_parquet(os.path.join(output_dir, "summary.parquet"))
+    print(f"✔️  {len(specs) - failures}/{len(specs)} specs written to {output_dir}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run dynamic portfolio backtests in batch, without Streamlit.")
+    parser.add_argument("specs", help="YAML or JSON file with a list of backtest specs")
+    parser.add_argument("--prices", default="Data/prices.parquet", help="Merged price file (default: %(default)s)")
+    parser.add_argument("--output-dir", default="results", help="Directory for Parquet results (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    specs = load_specs(args.specs)
+    summary = run_batch(specs, args.prices, args.output_dir, args.workers)
+    completed = summary["name"].nunique() if not summary.empty else 0
+    return 0 if completed == len(specs) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
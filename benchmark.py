@@ -0,0 +1,240 @@
+# benchmark.py
+"""
+Benchmark suite for the optimizer and backtest hot paths.
+
+Times each optimizer per call, full backtests at several rebalance frequencies and the
+price-merge step on synthetic random-walk price panels, appends the results to a JSON
+history and compares them against a saved baseline. Runs offline on a plain Linux box.
+
+Usage:
+    python benchmark.py                                  # default grid, compare to baseline
+    python benchmark.py --assets 10 100 1000 --years 1 10 --rebalance 1 7 30
+    python benchmark.py --save-baseline                  # record this run as the new baseline
+    python benchmark.py --quick --fail-on-regression     # small grid, exit 1 if slower
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import optimizer
+from merge_price_data import append_price_data, merge_price_data
+from utils import dynamic_backtest_portfolios
+
+DEFAULT_HISTORY = "bench_history.json"
+DEFAULT_BASELINE = "bench_baseline.json"
+
+
+# === Synthetic Data ===
+def synthetic_prices(n_assets, years, seed=0, late_listing_fraction=0.2):
+    """
+    Daily random-walk price panel (n_assets columns, years * 365 rows). A fraction of the
+    coins list late and are backfilled with their first price, like merge_price_data output.
+    """
+    rng = np.random.default_rng(seed)
+    n_days = int(years * 365)
+    vols = rng.uniform(0.02, 0.08, n_assets)
+    market = rng.normal(0.0005, 0.03, (n_days, 1))
+    log_returns = 0.6 * market + rng.normal(0, 1, (n_days, n_assets)) * vols
+    prices = 100 * np.exp(np.cumsum(log_returns, axis=0))
+    n_late = int(n_assets * late_listing_fraction)
+    for j in rng.choice(n_assets, n_late, replace=False):
+        listing = rng.integers(1, max(n_days // 2, 2))
+        prices[:listing, j] = prices[listing, j]
+    index = pd.date_range("2015-01-01", periods=n_days, freq="D", name="date")
+    return pd.DataFrame(prices, index=index, columns=[f"COIN{j}" for j in range(n_assets)])
+
+
+def write_raw_coin_files(prices, root_dir):
+    """Write prices in the raw per-coin layout merge_price_data reads (log_10(x)/10 closes)."""
+    for coin in prices.columns:
+        folder = os.path.join(root_dir, coin)
+        os.makedirs(folder, exist_ok=True)
+        pd.DataFrame({
+            "date": prices.index,
+            "open": 0.0,
+            "close": np.log10(prices[coin].to_numpy()) / 10,
+            "volume": 0.0,
+        }).to_parquet(os.path.join(folder, f"{coin}_USD.parquet"), index=False)
+
+
+# === Timing ===
+def time_call(func, repeat=3):
+    """Best wall-clock time of func() over repeat runs, in seconds."""
+    best = np.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_optimizers(prices, lookback_days, repeat):
+    window = prices.iloc[-lookback_days - 1:]
+    cases = {
+        "Equal Weight": lambda: optimizer.equal_weight(window),
+        "HRB": lambda: optimizer.hrp(window),
+        "Mean Variance": lambda: optimizer.mean_variance_opt(window, nonnegative=True),
+        "Mean Variance (long/short)": lambda: optimizer.mean_variance_opt(window, nonnegative=False),
+    }
+    for case in cases.values():
+        case()  # warm up (imports, solver construction)
+    return {name: time_call(case, repeat) for name, case in cases.items()}
+
+
+def bench_backtests(prices, methods, lookback_days, rebalance_grid, repeat):
+    return {
+        f"rebalance={rebalance_days}": time_call(
+            lambda: dynamic_backtest_portfolios(prices, methods, lookback_days, rebalance_days, True), repeat)
+        for rebalance_days in rebalance_grid
+    }
+
+
+def bench_merge(prices, repeat):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_merge_")
+    try:
+        raw_dir = os.path.join(tmp_dir, "raw")
+        output = os.path.join(tmp_dir, "prices.parquet")
+        write_raw_coin_files(prices, raw_dir)
+        full = time_call(lambda: merge_price_data(raw_dir, output), repeat)
+        append = time_call(lambda: append_price_data(raw_dir, output), repeat)
+        return {"full rebuild": full, "append (no changes)": append}
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def run_benchmarks(assets_grid, years_grid, rebalance_grid, methods, lookback_days=90, repeat=3, merge=True):
+    """Run every benchmark over the size grid. Returns {benchmark name: seconds}."""
+    results = {}
+    for n_assets in assets_grid:
+        for years in years_grid:
+            size = f"{n_assets} assets x {years}y"
+            prices = synthetic_prices(n_assets, years)
+            print(f"⏱️  {size}")
+            for name, seconds in bench_optimizers(prices, lookback_days, repeat).items():
+                results[f"optimizer/{name}/{size}"] = seconds
+            for name, seconds in bench_backtests(prices, methods, lookback_days, rebalance_grid, repeat).items():
+                results[f"backtest/{name}/{size}"] = seconds
+            if merge:
+                # merge_price_data prints a summary per call; keep the benchmark output readable.
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    merge_results = bench_merge(prices, repeat)
+                for name, seconds in merge_results.items():
+                    results[f"merge/{name}/{size}"] = seconds
+    return results
+
+
+# === History and Baseline ===
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_record(results, config):
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+
+
+def append_history(record, path=DEFAULT_HISTORY):
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    history.append(record)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=2)
+
+
+def compare_to_baseline(results, baseline_results, threshold=1.2):
+    """
+    Table of baseline vs current seconds per benchmark. A benchmark counts as a regression
+    when it is more than threshold times slower than the baseline.
+    """
+    rows = []
+    for name, seconds in results.items():
+        base = baseline_results.get(name)
+        ratio = seconds / base if base else np.nan
+        rows.append({
+            "benchmark": name,
+            "baseline_s": base,
+            "current_s": seconds,
+            "ratio": ratio,
+            "regression": bool(ratio > threshold) if base else False,
+        })
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark optimizer, backtest and data-merge hot paths.")
+    parser.add_argument("--assets", type=int, nargs="+", default=[10, 100], help="Asset counts (default: %(default)s)")
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 3], help="History lengths in years (default: %(default)s)")
+    parser.add_argument("--rebalance", type=int, nargs="+", default=[1, 7, 30], help="Rebalance periods in days (default: %(default)s)")
+    parser.add_argument("--methods", nargs="+", default=list(optimizer.OPTIMIZERS), help="Methods for the backtest benchmarks")
+    parser.add_argument("--lookback", type=int, default=90, help="Lookback window in days (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the best time is kept (default: %(default)s)")
+    parser.add_argument("--no-merge", action="store_true", help="Skip the data-merge benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Small grid for a fast smoke run")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history file (default: %(default)s)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="Save this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio counted as a regression (default: %(default)s)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any benchmark regressed")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.assets, args.years, args.rebalance, args.repeat = [10], [1], [7, 30], 1
+
+    config = {
+        "assets": args.assets, "years": args.years, "rebalance": args.rebalance, "methods": args.methods,
+        "lookback": args.lookback, "repeat": args.repeat, "merge": not args.no_merge,
+    }
+    results = run_benchmarks(args.assets, args.years, args.rebalance, args.methods, args.lookback, args.repeat,
+                             merge=not args.no_merge)
+    record = make_record(results, config)
+    append_history(record, args.history)
+
+    exit_code = 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison = compare_to_baseline(results, baseline["results"], args.threshold)
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(comparison.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+        regressions = comparison[comparison["regression"]]
+        if len(regressions):
+            print(f"⚠️  {len(regressions)} benchmark(s) more than {args.threshold:.2f}x slower than baseline "
+                  f"({baseline.get('commit')}, {baseline.get('timestamp')})")
+            exit_code = 1 if args.fail_on_regression else 0
+    else:
+        for name, seconds in results.items():
+            print(f"{name:60s} {seconds:.4f}s")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(record, f, indent=2)
+        print(f"✅ Saved baseline to {args.baseline}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+# bootstrap.py
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# === Stationary Block Bootstrap ===
+# Resamples a backtest's return history into many alternative paths to show how fragile its
+# Sharpe ratio, drawdown and tail losses are. Paths are generated as one index array per chunk
+# and every metric is computed for all paths of a chunk in vectorized NumPy passes.
+
+BOOTSTRAP_METRICS = ("sharpe", "max_drawdown", "cvar")
+# Default memory budget of one chunk of paths (index arrays and resampled returns).
+CHUNK_BYTES = 64 * 2 ** 20
+
+
+def chunk_paths(n_obs, n_series, max_bytes=CHUNK_BYTES, itemsize=8):
+    """
+    Number of paths per chunk that keeps a chunk's arrays within max_bytes. Per path, index
+    generation holds about five (n_obs,) integer arrays, and the metrics about four
+    (n_obs, n_series) arrays of returns (resampled returns, wealth, running peak, CVaR partition).
+    """
+    bytes_per_path = n_obs * (5 * np.dtype(np.intp).itemsize + 4 * itemsize * n_series)
+    return max(1, int(max_bytes // max(bytes_per_path, 1)))
+
+
+def stationary_bootstrap_indices(n_obs, n_paths, mean_block, rng):
+    """
+    Row indices of n_paths stationary-bootstrap paths (Politis & Romano) of length n_obs.
+
+    Each path is a sequence of blocks with geometrically distributed lengths (mean mean_block)
+    starting at uniformly random rows and wrapping around the end of the sample. Returns an
+    int array of shape (n_paths, n_obs).
+    """
+    starts = rng.integers(0, n_obs, size=(n_paths, n_obs))
+    new_block = rng.random((n_paths, n_obs)) < 1 / mean_block
+    new_block[:, 0] = True
+    steps = np.arange(n_obs)
+    # Position in the path where the current block began, carried forward along each path.
+    block_begin = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+    block_start = np.take_along_axis(starts, block_begin, axis=1)
+    return (block_start + steps - block_begin) % n_obs
+
+
+def path_metrics(path_returns, periods_per_year=365, cvar_level=0.05):
+    """
+    Annualized Sharpe ratio, maximum drawdown and CVaR (mean of the worst cvar_level fraction
+    of bar returns) of every path, for an array of path returns (rows = paths, axis 1 = bars,
+    optionally a trailing axis of series). Returns a dict of arrays, one value per path (and series).
+    """
+    n_obs = path_returns.shape[1]
+    mean = path_returns.mean(axis=1)
+    std = path_returns.std(axis=1, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > 0, np.sqrt(periods_per_year) * mean / std, np.nan)
+
+    wealth = np.cumprod(1 + path_returns, axis=1)
+    max_drawdown = (wealth / np.maximum.accumulate(wealth, axis=1) - 1).min(axis=1)
+
+    n_tail = max(int(np.ceil(cvar_level * n_obs)), 1)
+    cvar = np.partition(path_returns, n_tail - 1, axis=1)[:, :n_tail].mean(axis=1)
+    return {"sharpe": sharpe, "max_drawdown": max_drawdown, "cvar": cvar}
+
+
+# Per-process copy of the return matrix, set up once by _init_bootstrap_worker.
+_bootstrap_returns = None
+
+
+def _init_bootstrap_worker(returns):
+    global _bootstrap_returns
+    _bootstrap_returns = returns
+
+
+def _bootstrap_chunk(seed, n_paths, mean_block, periods_per_year, cvar_level, returns=None):
+    """Metrics for one chunk of paths; the same resampled rows are used for every series."""
+    returns = _bootstrap_returns if returns is None else returns
+    rng = np.random.default_rng(seed)
+    indices = stationary_bootstrap_indices(len(returns), n_paths, mean_block, rng)
+    return path_metrics(returns[indices], periods_per_year, cvar_level)
+
+
+def bootstrap_metrics(returns, n_paths=2000, mean_block=20, chunk_size=None, seed=0, periods_per_year=365,
+                      cvar_level=0.05, max_workers=1, max_chunk_bytes=CHUNK_BYTES):
+    """
+    Stationary block-bootstrap distributions of Sharpe ratio, maximum drawdown and CVaR.
+
+    All series are resampled with the same paths, so a matrix of portfolio returns (one column
+    per method) or asset returns gives paired distributions that can be compared path by path.
+    Paths are processed in chunks sized to a memory budget, and each chunk gets its own seed
+    spawned from seed, so results don't depend on max_workers.
+
+    Parameters:
+      returns (Series or DataFrame): Bar returns (rows = bars, columns = series), without NaNs.
+      n_paths (int): Number of bootstrap paths.
+      mean_block (float): Mean block length in bars (longer blocks keep more autocorrelation).
+      chunk_size (int): Paths generated and evaluated per vectorized pass. Defaults to as many
+            as fit in max_chunk_bytes for this history length and number of series.
+      seed (int): Seed for the random number generator.
+      periods_per_year (float): Bars per year, for annualizing the Sharpe ratio.
+      cvar_level (float): Tail fraction for CVaR (0.05 = mean of the worst 5% of bar returns).
+      max_workers (int): 1 evaluates the chunks in this process; otherwise they are spread
+            across a process pool of this size (None for the CPU count).
+      max_chunk_bytes (int): Memory budget of one chunk (per worker), see chunk_paths.
+
+    Returns:
+      dict: Maps each series name to a DataFrame with one row per path and columns
+            "sharpe", "max_drawdown" and "cvar".
+    """
+    frame = returns.to_frame() if isinstance(returns, pd.Series) else returns
+    values = np.ascontiguousarray(frame.to_numpy(dtype=np.float64))
+    if len(values) < 2:
+        raise ValueError("The bootstrap needs at least two return rows.")
+    if mean_block < 1:
+        raise ValueError(f"mean_block must be at least 1, got {mean_block!r}")
+
+    if chunk_size is None:
+        chunk_size = chunk_paths(len(values), values.shape[1], max_chunk_bytes, values.itemsize)
+    chunk_sizes = [min(chunk_size, n_paths - done) for done in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    options = (mean_block, periods_per_year, cvar_level)
+    if max_workers == 1:
+        chunks = [_bootstrap_chunk(s, size, *options, returns=values) for s, size in zip(seeds, chunk_sizes)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_bootstrap_worker, initargs=(values,)) as executor:
+            chunks = list(executor.map(_bootstrap_chunk, seeds, chunk_sizes, *[[option] * len(seeds) for option in options]))
+
+    return {
+        name: pd.DataFrame({metric: np.concatenate([chunk[metric][:, j] for chunk in chunks]) for metric in BOOTSTRAP_METRICS})
+        for j, name in enumerate(frame.columns)
+    }
+
+
+def confidence_intervals(distribution, level=0.95):
+    """Lower bound, median and upper bound of each metric's bootstrap distribution."""
+    tail = (1 - level) / 2
+    return distribution.quantile([tail, 0.5, 1 - tail]).T.set_axis(["lower", "median", "upper"], axis=1)
@@ -0,0 +1,204 @@
+# covariance.py
+import numpy as np
+from scipy.signal import lfilter
+
+# Covariance estimators selectable in the app: a sliding-window sample estimate (with
+# Ledoit-Wolf shrinkage for MVO) or an exponentially weighted moving average.
+COV_METHODS = ("sample", "ewma")
+
+
+# === Rolling Covariance Estimator ===
+class RollingCovariance:
+    """
+    Streaming covariance/correlation estimator over a sliding window of return rows.
+
+    Keeps running sums that are updated as rows enter and leave the window, so moving the
+    window by one day costs O(n²) instead of refitting on the whole window. Besides the first
+    and second moments it tracks the fourth-order cross sums needed to apply Ledoit-Wolf
+    shrinkage analytically (matching sklearn.covariance.LedoitWolf), so HRP and MVO can share
+    one estimate per rebalance.
+    """
+
+    def __init__(self, n_assets):
+        self.n_assets = n_assets
+        self.reset()
+
+    def reset(self):
+        n = self.n_assets
+        self.count = 0
+        self.sum = np.zeros(n)               # sum_i x_i
+        self.cross = np.zeros((n, n))        # sum_i x_i x_i'
+        self.sq_lin = np.zeros((n, n))       # [j, k] = sum_i x_ij² x_ik
+        self.sq_cross = np.zeros((n, n))     # [j, k] = sum_i x_ij² x_ik²
+
+    def _update(self, rows, sign):
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, self.n_assets)
+        if len(rows) == 0:
+            return
+        squares = rows ** 2
+        self.count += sign * len(rows)
+        self.sum += sign * rows.sum(axis=0)
+        self.cross += sign * (rows.T @ rows)
+        self.sq_lin += sign * (squares.T @ rows)
+        self.sq_cross += sign * (squares.T @ squares)
+
+    def add(self, rows):
+        """Add return rows (shape (k, n_assets)) entering the window."""
+        self._update(rows, 1)
+
+    def remove(self, rows):
+        """Remove return rows (shape (k, n_assets)) leaving the window."""
+        self._update(rows, -1)
+
+    def estimate(self, idx=None):
+        """
+        Covariance estimates for the current window, optionally restricted to asset positions idx.
+
+        Returns a dict with the sample covariance ("cov", ddof=1), the sample correlation ("corr"),
+        the Ledoit-Wolf shrunk covariance ("shrunk_cov"), the mean return ("mean") and the number
+        of observations ("n_obs"), or None if the window holds fewer than two rows.
+        """
+        n_obs = self.count
+        if n_obs < 2:
+            return None
+        if idx is None:
+            idx = np.arange(self.n_assets)
+        sub = np.ix_(idx, idx)
+        total = self.sum[idx]
+        cross = self.cross[sub]
+        mean = total / n_obs
+
+        # Centered second moments.
+        scatter = cross - n_obs * np.outer(mean, mean)
+        scatter = (scatter + scatter.T) / 2
+        cov = scatter / (n_obs - 1)
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = np.clip(cov / np.outer(std, std), -1, 1)
+
+        return {
+            "cov": cov,
+            "corr": corr,
+            "shrunk_cov": self._ledoit_wolf(idx, scatter, mean, n_obs),
+            "mean": mean,
+            "n_obs": n_obs,
+        }
+
+    def _ledoit_wolf(self, idx, scatter, mean, n_obs):
+        """Ledoit-Wolf shrinkage toward a scaled identity, computed from the running sums."""
+        n_features = len(idx)
+        sub = np.ix_(idx, idx)
+        emp_cov = scatter / n_obs
+        emp_cov_trace = np.diag(emp_cov)
+        mu = emp_cov_trace.sum() / n_features
+
+        # sum_i (x_ij - m_j)² (x_ik - m_k)², expanded into the raw sums.
+        sq = np.diag(self.cross)[idx]
+        sq_lin = self.sq_lin[sub]
+        mean_sq = mean ** 2
+        centered_sq_cross = (
+            self.sq_cross[sub]
+            - 2 * sq_lin * mean[None, :]
+            - 2 * sq_lin.T * mean[:, None]
+            + np.outer(sq, mean_sq)
+            + np.outer(mean_sq, sq)
+            + 4 * self.cross[sub] * np.outer(mean, mean)
+            - 3 * n_obs * np.outer(mean_sq, mean_sq)
+        )
+        beta_ = centered_sq_cross.sum()
+        delta_ = (scatter ** 2).sum() / n_obs ** 2
+        beta = (beta_ / n_obs - delta_) / (n_features * n_obs)
+        delta = (delta_ - 2 * mu * emp_cov_trace.sum() + n_features * mu ** 2) / n_features
+        beta = min(beta, delta)
+        shrinkage = 0.0 if beta == 0 else beta / delta
+
+        shrunk_cov = (1 - shrinkage) * emp_cov
+        shrunk_cov.flat[::n_features + 1] += shrinkage * mu
+        return shrunk_cov
+
+
+# === EWMA Covariance Estimator ===
+class EWMACovariance:
+    """
+    Exponentially weighted covariance/correlation estimator with a configurable half-life.
+
+    Updated recursively, so each new day is an O(n²) update and long histories can be run
+    with a short effective memory without slicing and reprocessing large windows:
+        d = x - mean;  mean += alpha * d;  cov = (1 - alpha) * (cov + alpha * d d')
+    with alpha = 1 - 0.5 ** (1 / halflife). halflife is measured in rows (bars).
+    """
+
+    def __init__(self, n_assets, halflife):
+        if halflife <= 0:
+            raise ValueError(f"halflife must be positive, got {halflife!r}")
+        self.n_assets = n_assets
+        self.halflife = halflife
+        self.alpha = 1 - 0.5 ** (1 / halflife)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = np.zeros(self.n_assets)
+        self.cov = np.zeros((self.n_assets, self.n_assets))
+
+    def add(self, rows):
+        """
+        Feed return rows (shape (k, n_assets)) in chronological order. A block of rows is
+        applied in one vectorized step: the running means follow a first-order linear filter,
+        and unrolling the recursion gives
+            cov_k = (1 - alpha)^k cov_0 + sum_t alpha (1 - alpha)^(k - t + 1) d_t d_t'
+        """
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, self.n_assets)
+        if len(rows) == 0:
+            return
+        if self.count == 0:
+            self.mean = rows[0].copy()
+            self.count = 1
+            rows = rows[1:]
+            if len(rows) == 0:
+                return
+        alpha = self.alpha
+        decay = 1 - alpha
+        k = len(rows)
+        # Means after each row: m_t = decay * m_{t-1} + alpha * x_t, seeded with the current mean.
+        means = lfilter([alpha], [1, -decay], rows, axis=0, zi=(decay * self.mean)[None, :])[0]
+        deltas = rows - np.vstack([self.mean, means[:-1]])
+        row_weights = alpha * decay ** np.arange(k, 0, -1)
+        self.cov = decay ** k * self.cov + (deltas * row_weights[:, None]).T @ deltas
+        self.mean = means[-1].copy()
+        self.count += k
+
+    def estimate(self, idx=None):
+        """
+        Same dict as RollingCovariance.estimate, with the EWMA mean as "mean". The EWMA covariance
+        is used directly as "shrunk_cov" (the MVO solver adds jitter if it is only semi-definite).
+        """
+        if self.count < 2:
+            return None
+        if idx is None:
+            idx = np.arange(self.n_assets)
+        cov = self.cov[np.ix_(idx, idx)]
+        cov = (cov + cov.T) / 2
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = np.clip(cov / np.outer(std, std), -1, 1)
+        return {"cov": cov, "corr": corr, "shrunk_cov": cov, "mean": self.mean[idx].copy(), "n_obs": self.count}
+
+
+def make_estimator(n_assets, cov_method="sample", halflife=None):
+    """Build the streaming estimator for cov_method ("sample" or "ewma")."""
+    if cov_method == "sample":
+        return RollingCovariance(n_assets)
+    if cov_method == "ewma":
+        if halflife is None:
+            raise ValueError("EWMA covariance requires a halflife")
+        return EWMACovariance(n_assets, halflife)
+    raise ValueError(f"Unknown covariance method: {cov_method!r}. Available: {list(COV_METHODS)}")
+
+
+def window_estimate(returns, cov_method="sample", halflife=None):
+    """One-off covariance estimate for a window of returns (array or DataFrame, rows = days)."""
+    values = np.asarray(returns, dtype=np.float64)
+    estimator = make_estimator(values.shape[1], cov_method, halflife)
+    estimator.add(values)
+    return estimator.estimate()
@@ -1,5 +1,16 @@
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from price_store import compact_prices, price_files as stored_price_files, write_part, write_prices
+
+# Appended part files kept before append_price_data folds them back into the merged file.
+MAX_PARTS = 32
 
 def fill_starting_nan(series):
     """
@@ -12,47 +23,268 @@ def fill_starting_nan(series):
     return series
 
 
-def merge_price_data(root_dir, output_path="prices.parquet"):
-    all_prices = []
+def fill_starting_nans(values):
+    """
+    Vectorized, in-place version of fill_starting_nan for a 2-D array (rows = dates,
+    columns = assets): each column's leading NaNs take its first valid value.
+    """
+    valid = ~np.isnan(values)
+    has_data = valid.any(axis=0)
+    first_valid = valid.argmax(axis=0)
+    leading = (np.arange(len(values))[:, None] < first_valid[None, :]) & has_data[None, :]
+    first_values = values[first_valid, np.arange(values.shape[1])]
+    np.copyto(values, np.broadcast_to(first_values, values.shape), where=leading)
+    return values
+
 
+def forward_fill(values, block_bytes=16 * 2 ** 20):
+    """
+    In-place forward fill of a 2-D array (rows = dates, columns = assets), like DataFrame.ffill.
+    Rows are processed in blocks of about block_bytes, each seeded with the last row of the
+    previous block, so the temporaries stay block-sized instead of copying the whole array.
+    """
+    block_rows = max(1, block_bytes // (np.dtype(np.intp).itemsize * max(values.shape[1], 1)))
+    for lo in range(0, len(values), block_rows):
+        block = values[max(lo - 1, 0):lo + block_rows]
+        missing = np.isnan(block)
+        if not missing.any():
+            continue
+        # Row of the last valid value at or before each cell (row 0 is the seed).
+        source = np.where(missing, 0, np.arange(len(block))[:, None])
+        np.maximum.accumulate(source, axis=0, out=source)
+        block[missing] = block[source[missing], np.nonzero(missing)[1]]
+    return values
+
+
+def find_price_files(root_dir):
+    """List (coin, file_path) for every *_USD.parquet file in the coin folders under root_dir."""
+    price_files = []
     for coin_folder in os.listdir(root_dir):
         folder_path = os.path.join(root_dir, coin_folder)
         if os.path.isdir(folder_path):
             for file in os.listdir(folder_path):
                 if file.endswith("_USD.parquet"):
-                    file_path = os.path.join(folder_path, file)
-                    try:
-                        df = pd.read_parquet(file_path)
-                        coin = file.replace("_USD.parquet", "")
-                        df = df[["date", "close"]].copy()
-                        df["date"] = pd.to_datetime(df["date"])
+                    price_files.append((file.replace("_USD.parquet", ""), os.path.join(folder_path, file)))
+    return price_files
+
+
+def _read_dates(file_path):
+    table = pq.read_table(file_path, columns=["date"])
+    return pd.to_datetime(table.column("date").to_pandas()).to_numpy()
+
+
+def _read_close(file_path, after=None):
+    """
+    Read only the date and close columns and undo the log_10(x)/10 transformation.
+    If after is given, only rows dated after it are returned (pushed down to Parquet when possible).
+    """
+    try:
+        filters = [("date", ">", after)] if after is not None else None
+        table = pq.read_table(file_path, columns=["date", "close"], filters=filters)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, TypeError):
+        # e.g. dates stored as strings: filter after reading instead.
+        table = pq.read_table(file_path, columns=["date", "close"])
+    dates = pd.to_datetime(table.column("date").to_pandas()).to_numpy()
+    close = table.column("close").to_numpy(zero_copy_only=False).astype(np.float64)
+    if after is not None:
+        newer = dates > np.datetime64(after)
+        dates, close = dates[newer], close[newer]
+
+    # Invert log_10(x)/10 transformation if applied
+    return dates, 10 ** (close * 10)
+
+
+def manifest_path_for(output_path):
+    """Default location of the manifest kept next to the merged price file."""
+    return os.path.splitext(output_path)[0] + "_manifest.json"
+
+
+def _write_manifest(manifest_path, files, last_date, parts=()):
+    manifest = {"last_date": pd.Timestamp(last_date).isoformat(), "files": files, "parts": list(parts)}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
 
-                        # Invert log_10(x)/10 transformation if applied
-                        df["close"] = 10 ** (df["close"] * 10)
+def _file_entry(file_path, coin_dates, previous=None):
+    """Manifest entry for one source file: its modification time and last date seen."""
+    last_date = pd.Timestamp(coin_dates.max()).isoformat() if len(coin_dates) else None
+    if last_date is None and previous is not None:
+        last_date = previous.get("last_date")
+    return {"path": file_path, "mtime": os.path.getmtime(file_path), "last_date": last_date}
 
-                        df = df.rename(columns={"close": coin})
-                        df = df.set_index("date")
-                        all_prices.append(df)
-                    except Exception as e:
-                        print(f"Error loading {file_path}: {e}")
 
-    # Outer join on all dates
-    merged = pd.concat(all_prices, axis=1).sort_index()
+def merge_price_data(root_dir, output_path="prices.parquet", dtype=np.float64, max_workers=None, manifest_path=None):
+    """
+    Merge every coin's *_USD.parquet close prices into one wide price file.
+
+    Files are read in parallel on a thread pool with pyarrow, projecting only the date and
+    close columns. A first pass reads just the dates to size the output, then each coin's
+    prices are scattered into one preallocated matrix as its read completes, and the matrix is
+    filled in place and written a year at a time, so peak memory stays close to the size of
+    the result however many coins there are.
+
+    Parameters:
+      root_dir (str): Folder containing one sub-folder per coin.
+      output_path (str): Where to write the merged Parquet file.
+      dtype: Output float type (np.float64, or np.float32 to halve the file and memory size).
+      max_workers (int): Number of reader threads (defaults to ThreadPoolExecutor's default).
+      manifest_path (str): Where to record each source file's mtime and last date for
+            append_price_data (defaults to <output>_manifest.json).
+    """
+    price_files = find_price_files(root_dir)
+
+    # Pass 1: union of all dates.
+    file_dates = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_read_dates, path): (coin, path) for coin, path in price_files}
+        for future in as_completed(futures):
+            coin, file_path = futures.pop(future)  # drop the reference so each result can be freed
+            try:
+                file_dates[file_path] = future.result()
+            except Exception as e:
+                print(f"Error loading {file_path}: {e}")
+    price_files = [(coin, path) for coin, path in price_files if path in file_dates]
+    if not price_files:
+        raise ValueError(f"No readable *_USD.parquet files found under {root_dir}")
+    dates = np.unique(np.concatenate(list(file_dates.values())))
+    file_dates.clear()
+
+    # Pass 2: scatter each coin's prices into the preallocated matrix (outer join on all dates).
+    values = np.full((len(dates), len(price_files)), np.nan, dtype=dtype)
+    loaded = np.zeros(len(price_files), dtype=bool)
+    manifest_files = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_read_close, path): (j, path) for j, (coin, path) in enumerate(price_files)}
+        for future in as_completed(futures):
+            j, file_path = futures.pop(future)
+            try:
+                coin_dates, close = future.result()
+            except Exception as e:
+                print(f"Error loading {file_path}: {e}")
+                continue
+            values[np.searchsorted(dates, coin_dates), j] = close
+            loaded[j] = True
+            manifest_files[price_files[j][0]] = _file_entry(file_path, coin_dates)
+
+    columns = [coin for (coin, _), ok in zip(price_files, loaded) if ok]
+    values = values[:, loaded] if not loaded.all() else values
 
     # Backfill leading NaNs with first known price
-    merged = merged.apply(fill_starting_nan)
+    fill_starting_nans(values)
 
     # Forward-fill subsequent missing prices
-    merged = merged.ffill()
+    forward_fill(values)
 
     # Drop rows where all assets are still NaN (before any coin had data)
-    merged = merged.dropna(how="all")
+    has_data = ~np.isnan(values).all(axis=1)
+    if not has_data.all():
+        values, dates = values[has_data], dates[has_data]
+
+    merged = pd.DataFrame(values, index=pd.DatetimeIndex(dates, name="date"), columns=columns, copy=False)
 
-    # Save to Parquet
-    merged.to_parquet(output_path)
+    # Save to Parquet (one row group per year, plus the metadata sidecar)
+    write_prices(merged, output_path)
+    _write_manifest(manifest_path or manifest_path_for(output_path), manifest_files, merged.index.max())
     print(f"✅ Saved merged file: {output_path}")
     print(f"✔️  {len(merged.columns)} assets | 📅 {merged.index.min().date()} → {merged.index.max().date()} | 📈 {len(merged)} rows")
 
+
+def append_price_data(root_dir, output_path="prices.parquet", max_workers=None, manifest_path=None):
+    """
+    Incrementally bring an existing merged price file up to date.
+
+    Uses the manifest written by merge_price_data to skip source files whose modification
+    time hasn't changed, reads only rows newer than each file's last date in the manifest,
+    applies the 10 ** (close * 10) inversion and forward-fills from the existing last row
+    (the seam), and writes the new dates as a part file next to output_path (see price_store),
+    so an append costs time proportional to the new rows rather than the whole history. The
+    manifest lists the parts; once there are MAX_PARTS of them they are compacted into
+    output_path. Falls back to a full merge_price_data rebuild when there is no manifest, the
+    parts on disk don't match it, the set of coins changed (a new coin needs its history
+    backfilled), or a coin that lagged behind the others gained rows at dates already stored
+    (those rows were forward-filled and have to be replaced).
+    """
+    manifest_path = manifest_path or manifest_path_for(output_path)
+    price_files = find_price_files(root_dir)
+    if not os.path.exists(output_path) or not os.path.exists(manifest_path):
+        print("No existing merged file or manifest found, running a full rebuild.")
+        return merge_price_data(root_dir, output_path, max_workers=max_workers, manifest_path=manifest_path)
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    parquet_file = pq.ParquetFile(output_path)
+    schema = parquet_file.schema_arrow
+    columns = [name for name in schema.names if name in manifest["files"]]
+    if sorted(coin for coin, _ in price_files) != sorted(manifest["files"]) or len(columns) != len(manifest["files"]):
+        print("Set of coins changed since the last merge, running a full rebuild.")
+        return merge_price_data(root_dir, output_path, max_workers=max_workers, manifest_path=manifest_path)
+    stored_files = stored_price_files(output_path)
+    parts = [os.path.basename(part) for part in stored_files[1:]]
+    if parts != manifest.get("parts", []):
+        print("Part files don't match the manifest, running a full rebuild.")
+        return merge_price_data(root_dir, output_path, max_workers=max_workers, manifest_path=manifest_path)
+
+    last_date = pd.Timestamp(manifest["last_date"])
+    changed = [
+        (coin, path) for coin, path in price_files
+        if os.path.getmtime(path) != manifest["files"][coin]["mtime"]
+    ]
+
+    # Read only rows newer than what each file had at the last merge.
+    new_rows = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_read_close, path, manifest["files"][coin].get("last_date")): (coin, path)
+            for coin, path in changed
+        }
+        for future in as_completed(futures):
+            coin, file_path = futures[future]
+            try:
+                coin_dates, close = future.result()
+            except Exception as e:
+                print(f"Error loading {file_path}: {e}")
+                continue
+            new_rows[coin] = (coin_dates, close)
+            manifest["files"][coin] = _file_entry(file_path, coin_dates, manifest["files"][coin])
+
+    lagging = sorted(coin for coin, (coin_dates, _) in new_rows.items()
+                     if len(coin_dates) and coin_dates.min() <= np.datetime64(last_date))
+    if lagging:
+        print(f"New rows for already stored dates ({', '.join(lagging)}), running a full rebuild.")
+        return merge_price_data(root_dir, output_path, max_workers=max_workers, manifest_path=manifest_path)
+
+    new_dates = [coin_dates for coin_dates, _ in new_rows.values() if len(coin_dates)]
+    if not new_dates:
+        _write_manifest(manifest_path, manifest["files"], last_date, parts)
+        print(f"✅ {output_path} is already up to date ({len(changed)} changed files checked).")
+        return
+
+    dates = np.unique(np.concatenate(new_dates))
+    values = np.full((len(dates), len(columns)), np.nan)
+    positions = {coin: j for j, coin in enumerate(columns)}
+    for coin, (coin_dates, close) in new_rows.items():
+        values[np.searchsorted(dates, coin_dates), positions[coin]] = close
+
+    # Forward-fill only at the seam: seed with the last row already on disk (in the newest part).
+    parquet_file.close()
+    last_file = pq.ParquetFile(stored_files[-1])
+    last_group = last_file.read_row_group(last_file.num_row_groups - 1, columns=columns, use_pandas_metadata=True)
+    last_file.close()
+    seam = last_group.slice(last_group.num_rows - 1).to_pandas()
+    block = pd.DataFrame(values, index=pd.DatetimeIndex(dates, name=seam.index.name), columns=columns)
+    block = pd.concat([seam, block]).ffill().iloc[1:]
+    new_table = pa.Table.from_pandas(block, schema=schema, preserve_index=True)
+
+    # Write the new dates as a part file; compact once enough parts have piled up.
+    parts.append(write_part(new_table, output_path))
+    if len(parts) >= MAX_PARTS:
+        compact_prices(output_path)
+        parts = []
+
+    _write_manifest(manifest_path, manifest["files"], dates.max(), parts)
+    print(f"✅ Appended {len(dates)} rows to {output_path} from {len(changed)} changed files")
+    print(f"✔️  {len(columns)} assets | 📅 through {pd.Timestamp(dates.max()).date()}")
+
 # Example usage
 if __name__ == "__main__":
     merge_price_data('C:/Users/kfern/Desktop/Business/Crypto Site/App/Raw Data/')
@@ -0,0 +1,121 @@
+# metrics.py
+import numpy as np
+import pandas as pd
+
+# === Rolling Metrics Engine ===
+# Every method's bar returns are stacked into one (bars x methods) array and the running sums
+# behind all rolling metrics (returns, squared returns, squared downside returns, log growth)
+# are taken in a single cumulative-sum pass. Each window and metric is then a few vectorized
+# differences of those sums, so adding a metric or window costs O(bars x methods). Drawdowns
+# need the running peak inside every window, which costs O(bars x window x methods) and is
+# evaluated in chunks of at most DRAWDOWN_CHUNK_BYTES.
+
+ROLLING_METRICS = ("sharpe", "sortino", "volatility", "max_drawdown", "calmar")
+DRAWDOWN_CHUNK_BYTES = 64 * 2 ** 20
+
+
+def _window_max_drawdown(log_wealth, window):
+    """
+    Maximum drawdown of every trailing window of bars, with the running peak reset at the start
+    of each window. log_wealth is the (bars x series) cumulative log growth through each bar;
+    row t of the result covers bars t - window + 1 .. t (rows before window - 1 are NaN).
+    """
+    n_bars, n_series = log_wealth.shape
+    out = np.full((n_bars, n_series), np.nan)
+    if window > n_bars:
+        return out
+    # (windows x series x window) view, one window per row, without copying.
+    windows = np.lib.stride_tricks.sliding_window_view(log_wealth, window, axis=0)
+    rows_per_chunk = max(1, DRAWDOWN_CHUNK_BYTES // (8 * window * n_series))
+    with np.errstate(invalid="ignore"):
+        for lo in range(0, len(windows), rows_per_chunk):
+            block = windows[lo:lo + rows_per_chunk]
+            worst = (block - np.maximum.accumulate(block, axis=2)).min(axis=2)
+            out[window - 1 + lo:window - 1 + lo + len(block)] = np.expm1(worst)
+    return out
+
+
+def rolling_metric_arrays(values, windows=(30,), metrics=ROLLING_METRICS, periods_per_year=365):
+    """
+    Rolling metrics of a (bars x series) return array for several windows at once.
+
+    Metrics (all annualized with periods_per_year bars per year, over the trailing window bars):
+      sharpe        mean / standard deviation (ddof=1)
+      sortino       mean / downside deviation (root mean squared negative return)
+      volatility    standard deviation (ddof=1)
+      max_drawdown  worst drawdown within the window, measured from the running peak of
+                    the window's own bars (a negative fraction)
+      calmar        annualized compound return over the window / |max_drawdown|
+
+    Returns a dict mapping (metric, window) to a (bars x series) array, NaN for the first
+    window - 1 bars.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_bars, n_series = values.shape
+    unknown = set(metrics) - set(ROLLING_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown rolling metrics: {sorted(unknown)}. Available: {list(ROLLING_METRICS)}")
+
+    # One cumulative-sum pass for everything the metrics need.
+    def prefix(array):
+        return np.concatenate([np.zeros((1, n_series)), np.cumsum(array, axis=0)])
+
+    sums = prefix(values)
+    squares = prefix(values ** 2)
+    downside = prefix(np.minimum(values, 0) ** 2) if "sortino" in metrics else None
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_growth = prefix(np.log1p(values)) if {"max_drawdown", "calmar"} & set(metrics) else None
+
+    results = {}
+    for window in windows:
+        window = int(window)
+        out = {metric: np.full((n_bars, n_series), np.nan) for metric in metrics}
+        if 2 <= window <= n_bars:
+            rows = slice(window - 1, None)
+            mean = (sums[window:] - sums[:-window]) / window
+            variance = np.clip((squares[window:] - squares[:-window] - window * mean ** 2) / (window - 1), 0, None)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                if "sharpe" in out:
+                    out["sharpe"][rows] = np.sqrt(periods_per_year) * mean / np.sqrt(variance)
+                if "sortino" in out:
+                    downside_dev = np.sqrt((downside[window:] - downside[:-window]) / window)
+                    out["sortino"][rows] = np.sqrt(periods_per_year) * mean / downside_dev
+                if "volatility" in out:
+                    out["volatility"][rows] = np.sqrt(periods_per_year * variance)
+                if "max_drawdown" in out or "calmar" in out:
+                    max_drawdown = _window_max_drawdown(log_growth[1:], window)[rows]
+                    if "max_drawdown" in out:
+                        out["max_drawdown"][rows] = max_drawdown
+                    if "calmar" in out:
+                        annual_return = np.expm1((log_growth[window:] - log_growth[:-window]) * periods_per_year / window)
+                        out["calmar"][rows] = np.where(max_drawdown < 0, annual_return / -max_drawdown, np.nan)
+        for metric in metrics:
+            results[(metric, window)] = out[metric]
+    return results
+
+
+def rolling_metrics(returns, windows=(30,), metrics=ROLLING_METRICS, periods_per_year=365):
+    """
+    Long-format rolling metrics for every series of a returns DataFrame (one column per method).
+
+    Returns a DataFrame with columns "date", "Method", "window" (in bars), "metric" and "value",
+    ordered by metric, window and method, each series a contiguous block of len(returns) rows
+    on the same dates (Method and metric are categorical to keep the frame compact).
+    """
+    frame = returns.to_frame() if isinstance(returns, pd.Series) else returns
+    arrays = rolling_metric_arrays(frame.to_numpy(dtype=np.float64), windows, metrics, periods_per_year)
+    n_bars, n_series = len(frame), len(frame.columns)
+    keys = [(metric, int(window)) for metric in metrics for window in windows]
+    n_blocks = len(keys) * n_series
+    values = np.stack([arrays[key] for key in keys]).transpose(0, 2, 1).ravel() if keys else np.empty(0)
+    return pd.DataFrame({
+        "date": np.tile(frame.index.to_numpy(), n_blocks),
+        "Method": pd.Categorical(np.tile(np.repeat(np.asarray(frame.columns, dtype=object), n_bars), len(keys)),
+                                 categories=list(frame.columns)),
+        "window": np.repeat(np.array([window for _, window in keys], dtype=np.int32), n_series * n_bars),
+        "metric": pd.Categorical(np.repeat(np.array([metric for metric, _ in keys], dtype=object), n_series * n_bars),
+                                 categories=list(metrics)),
+        "value": values,
+    })
@@ -1,111 +1,481 @@
+import threading
+
 import numpy as np
 import pandas as pd
-from sklearn.covariance import LedoitWolf
 from scipy.cluster.hierarchy import linkage, leaves_list
-import cvxpy as cp
+from scipy.linalg import cho_factor, cho_solve
+# sklearn and cvxpy are slow to import and only needed by mean_variance_opt, so they are
+# imported where they are used; runs that only need Equal Weight or HRP never pay for them.
+
+from covariance import window_estimate
+from profiling import record_fallback, record_solve, stage
 
 def equal_weight(prices):
     n = len(prices.columns)
     return pd.Series([1/n]*n, index=prices.columns)
 
 # === Robust HRP Function ===
-def hrp(prices):
-    returns = prices.pct_change().dropna()
+HRP_LINKAGE_METHODS = ("single", "average", "ward", "complete")
+
+
+def hrp(prices, linkage_method="single", estimate=None):
+    """
+    Hierarchical risk parity weights. If a covariance estimate (see covariance.RollingCovariance)
+    for the window is passed in, its sample covariance and correlation are used instead of
+    recomputing them from prices.
+    """
+    if linkage_method not in HRP_LINKAGE_METHODS:
+        raise ValueError(f"Unknown HRP linkage method: {linkage_method!r}. Available: {list(HRP_LINKAGE_METHODS)}")
+
+    if estimate is not None:
+        # Drop assets with constant prices
+        keep = np.flatnonzero(np.diag(estimate["cov"]) > 0)
+        assets = prices.columns[keep]
+        cov = estimate["cov"][np.ix_(keep, keep)]
+        corr = estimate["corr"][np.ix_(keep, keep)]
+    else:
+        returns = prices.pct_change().dropna()
 
-    # Drop assets with any NaNs or constant prices
-    returns = returns.dropna(axis=1, how='any')
-    returns = returns.loc[:, returns.std() > 0]
+        # Drop assets with any NaNs or constant prices
+        returns = returns.dropna(axis=1, how='any')
+        returns = returns.loc[:, returns.std() > 0]
+        assets = returns.columns
 
-    if returns.shape[1] < 2:
+        values = returns.to_numpy(dtype=np.float64)
+        cov = np.cov(values, rowvar=False) if len(assets) >= 2 else None
+
+    if len(assets) < 2:
         # Not enough valid assets to proceed
+        record_fallback("HRB: fewer than 2 valid assets")
         n = len(prices.columns)
         return pd.Series([1/n]*n, index=prices.columns)
 
     # Distance matrix from correlation
-    corr = returns.corr()
+    if estimate is None:
+        std = np.sqrt(np.diag(cov))
+        corr = np.clip(cov / np.outer(std, std), -1, 1)
     dist = np.sqrt(0.5 * (1 - corr))
-    condensed_dist = dist.values[np.triu_indices_from(dist, k=1)]
+    condensed_dist = dist[np.triu_indices_from(dist, k=1)]
 
     if np.isnan(condensed_dist).any() or np.isinf(condensed_dist).any():
+        record_fallback("HRB: invalid distance matrix")
         n = len(prices.columns)
         return pd.Series([1/n]*n, index=prices.columns)
 
     # Hierarchical clustering
-    linkage_matrix = linkage(condensed_dist, method='single')
-    sort_ix = leaves_list(linkage_matrix)
-    sorted_assets = returns.columns[sort_ix]
-
-    def get_cluster_var(cov, assets):
-        sub_cov = cov.loc[assets, assets]
-        weights = np.ones(len(assets)) / len(assets)
-        return weights @ sub_cov @ weights
-
-    def recursive_weights(cov, assets):
-        if len(assets) == 1:
-            return pd.Series([1], index=assets)
-        split = len(assets) // 2
-        left = assets[:split]
-        right = assets[split:]
-        left_var = get_cluster_var(cov, left)
-        right_var = get_cluster_var(cov, right)
+    with stage("HRB: clustering"):
+        linkage_matrix = linkage(condensed_dist, method=linkage_method)
+        sort_ix = leaves_list(linkage_matrix)
+
+    with stage("HRB: bisection"):
+        weights = _hrp_bisection(cov, sort_ix)
+    return pd.Series(weights, index=assets).reindex(prices.columns).fillna(0)
+
+
+def _hrp_bisection(cov, sort_ix):
+    """
+    Recursive bisection of the quasi-diagonal ordering, run iteratively on integer positions.
+
+    Each cluster is a contiguous slice of the sorted order, so its equal-weight variance is a
+    block sum of the reordered covariance, read in O(1) from a 2-D prefix sum.
+    """
+    n = len(sort_ix)
+    sorted_cov = cov[np.ix_(sort_ix, sort_ix)]
+    block_sums = np.zeros((n + 1, n + 1))
+    block_sums[1:, 1:] = sorted_cov.cumsum(axis=0).cumsum(axis=1)
+
+    def cluster_var(lo, hi):
+        total = block_sums[hi, hi] - block_sums[lo, hi] - block_sums[hi, lo] + block_sums[lo, lo]
+        return total / (hi - lo) ** 2
+
+    sorted_weights = np.ones(n)
+    stack = [(0, n)]
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo < 2:
+            continue
+        mid = lo + (hi - lo) // 2
+        left_var = cluster_var(lo, mid)
+        right_var = cluster_var(mid, hi)
         alloc = 1 - left_var / (left_var + right_var)
-        return pd.concat([
-            recursive_weights(cov, left) * alloc,
-            recursive_weights(cov, right) * (1 - alloc)
-        ])
+        sorted_weights[lo:mid] *= alloc
+        sorted_weights[mid:hi] *= 1 - alloc
+        stack.append((lo, mid))
+        stack.append((mid, hi))
 
-    cov = returns.cov()
-    weights = recursive_weights(cov, sorted_assets)
-    return weights.reindex(prices.columns).fillna(0)
+    weights = np.empty(n)
+    weights[sort_ix] = sorted_weights
+    return weights
 
 
-# === Optimizer Wrapper ===
-def run_optimizers(prices, nonnegative_mvo=True):
-    equal = equal_weight(prices)
-    mvo = mean_variance_opt(prices, nonnegative=nonnegative_mvo)
-    hrb = hrp(prices)
-    return {"Equal Weight": equal, "Mean Variance": mvo, "HRB": hrb}
-def mean_variance_opt(prices, nonnegative=True):
-
-    # Compute returns and drop any rows with missing values
-    returns = prices.pct_change().dropna()
+def mean_variance_opt(prices, nonnegative=True, estimate=None):
+    """
+    Minimum-variance weights from a Ledoit-Wolf shrunk covariance. If a covariance estimate
+    (see covariance.RollingCovariance) for the window is passed in, its shrunk covariance is
+    used instead of refitting LedoitWolf on the window's returns.
+    """
     n_assets = len(prices.columns)
-    
-    # If no returns are available, fallback to equal weights
-    if returns.empty or len(returns) < 2:
-        return pd.Series(np.ones(n_assets) / n_assets, index=prices.columns)
-    
-    # Use a robust covariance estimator (optional, but often helps in noisy data)
-    try:
-        lw = LedoitWolf()
-        lw.fit(returns)
-        cov = lw.covariance_
-    except Exception:
-        # Fallback to the regular covariance if LedoitWolf fails
-        cov = returns.cov().values
+
+    if estimate is not None:
+        cov = estimate["shrunk_cov"]
+    else:
+        # Compute returns and drop any rows with missing values
+        returns = prices.pct_change().dropna()
+
+        # If no returns are available, fallback to equal weights
+        if returns.empty or len(returns) < 2:
+            record_fallback("Mean Variance: fewer than 2 return rows")
+            return pd.Series(np.ones(n_assets) / n_assets, index=prices.columns)
+
+        cov = _shrunk_covariance(returns)
 
     # Force symmetry to mitigate numerical precision issues.
     cov = (cov + cov.T) / 2
 
     # Check for any NaNs or infinite values in covariance; if found, fallback to equal weights.
     if np.isnan(cov).any() or np.isinf(cov).any():
+        record_fallback("Mean Variance: invalid covariance")
         return pd.Series(np.ones(n_assets) / n_assets, index=prices.columns)
 
-    # Set up and solve the quadratic optimization
-    w = cp.Variable(n_assets)
-    objective = cp.Minimize(cp.quad_form(w, cov))
-    constraints = [cp.sum(w) == 1]
-    if nonnegative:
-        constraints.append(w >= 0)
-    
-    prob = cp.Problem(objective, constraints)
-    prob.solve(solver=cp.SCS)  # Using SCS as a robust fallback solver
+    # Solve with the reusable solver for this asset count (closed form when shorting is allowed).
+    with stage("Mean Variance: solve"):
+        weights = get_mvo_solver(n_assets, nonnegative).solve(cov)
 
     # If the solver fails, return equal weights.
-    weights = w.value
     if weights is None:
+        record_fallback("Mean Variance: solver failed")
         return pd.Series(np.ones(n_assets) / n_assets, index=prices.columns)
-    
+
     return pd.Series(weights, index=prices.columns)
 
 
+def _shrunk_covariance(returns):
+    """Ledoit-Wolf covariance of a returns DataFrame, or the sample covariance if the fit fails."""
+    # Use a robust covariance estimator (optional, but often helps in noisy data)
+    try:
+        from sklearn.covariance import LedoitWolf
+        with stage("Mean Variance: Ledoit-Wolf"):
+            lw = LedoitWolf()
+            lw.fit(returns)
+        return lw.covariance_
+    except Exception:
+        # Fallback to the regular covariance if LedoitWolf fails
+        return returns.cov().values
+
+
+# === Reusable Mean-Variance Solver ===
+class MeanVarianceSolver:
+    """
+    Minimum-variance problem built once per asset count and re-solved as the covariance changes.
+
+    The covariance enters through its Cholesky factor as a cp.Parameter, which keeps the problem
+    DPP-compliant so cvxpy canonicalizes it only once; each solve is warm-started from the
+    previous weights. Without the nonnegativity constraint the minimum-variance portfolio has
+    the closed form w = inv(cov) @ 1 / (1' inv(cov) 1) and no solver is needed.
+    """
+
+    def __init__(self, n_assets, nonnegative=True):
+        self.n_assets = n_assets
+        self.nonnegative = nonnegative
+        self._lock = threading.Lock()
+        self._problem = None
+        if nonnegative:
+            import cvxpy as cp
+            self._chol_upper = cp.Parameter((n_assets, n_assets))
+            self._w = cp.Variable(n_assets)
+            constraints = [cp.sum(self._w) == 1, self._w >= 0]
+            # w' cov w == ||L' w||^2 with cov = L L'.
+            self._problem = cp.Problem(cp.Minimize(cp.sum_squares(self._chol_upper @ self._w)), constraints)
+
+    @staticmethod
+    def _cholesky(cov):
+        # Add a little jitter if the covariance is only positive semi-definite.
+        jitter = 0.0
+        scale = max(np.trace(cov) / len(cov), 1e-12)
+        for _ in range(5):
+            try:
+                return cho_factor(cov + jitter * np.eye(len(cov)), lower=True)
+            except np.linalg.LinAlgError:
+                jitter = scale * 1e-10 if jitter == 0.0 else jitter * 100
+        return None
+
+    def solve(self, cov):
+        """Return minimum-variance weights for cov, or None if no solution was found."""
+        factor = self._cholesky(cov)
+        if factor is None:
+            return None
+
+        if not self.nonnegative:
+            weights = cho_solve(factor, np.ones(self.n_assets))
+            total = weights.sum()
+            return weights / total if total != 0 and np.isfinite(total) else None
+
+        import cvxpy as cp
+        chol = np.tril(factor[0])
+        with self._lock:
+            self._chol_upper.value = chol.T
+            try:
+                self._problem.solve(solver=cp.SCS, warm_start=True)  # Using SCS as a robust fallback solver
+            except cp.error.SolverError:
+                record_solve("solver_error")
+                return None
+            stats = self._problem.solver_stats
+            record_solve(self._problem.status, stats.num_iters, stats.solve_time)
+            weights = self._w.value
+            return None if weights is None else weights.copy()
+
+
+_mvo_solvers = {}
+_mvo_solvers_lock = threading.Lock()
+
+
+def get_mvo_solver(n_assets, nonnegative=True):
+    """Return the shared MeanVarianceSolver for this problem shape, building it on first use."""
+    key = (n_assets, bool(nonnegative))
+    with _mvo_solvers_lock:
+        if key not in _mvo_solvers:
+            _mvo_solvers[key] = MeanVarianceSolver(n_assets, nonnegative)
+        return _mvo_solvers[key]
+
+
+# === Efficient Frontier ===
+def efficient_frontier(prices, n_points=25, nonnegative=True, estimate=None, risk_aversions=None):
+    """
+    Mean-variance efficient frontier for a price window, solved as one batch.
+
+    By default the frontier is traced at n_points target returns evenly spaced from the
+    minimum-variance portfolio's return up to the highest single-asset mean return. If
+    risk_aversions is given, one point is solved per risk aversion gamma instead, maximizing
+    mean' w - gamma / 2 * w' cov w. The covariance (Ledoit-Wolf shrunk, as in mean_variance_opt,
+    or estimate["shrunk_cov"]) is factored once for all points; see FrontierSolver.
+
+    Parameters:
+      prices (DataFrame): Price window (rows = bars, columns = assets).
+      n_points (int): Number of target-return points.
+      nonnegative (bool): Whether to constrain weights to be nonnegative.
+      estimate (dict): Optional covariance estimate with "shrunk_cov" and "mean" (see covariance.py).
+      risk_aversions (array-like): Optional risk aversions to solve for instead of target returns.
+
+    Returns:
+      dict: "weights", a DataFrame with one row per point and one column per asset (NaN rows
+            where no solution was found), and "points", a DataFrame with each point's
+            "target_return" or "risk_aversion", "expected_return" and "volatility" (per bar).
+    """
+    if estimate is not None and "mean" in estimate:
+        cov, mean = estimate["shrunk_cov"], estimate["mean"]
+    else:
+        returns = prices.pct_change().dropna()
+        if len(returns) < 2:
+            raise ValueError("The efficient frontier needs at least two return rows.")
+        cov, mean = _shrunk_covariance(returns), returns.mean().to_numpy(dtype=np.float64)
+    cov = (cov + cov.T) / 2
+    mean = np.asarray(mean, dtype=np.float64)
+
+    solver = get_frontier_solver(len(prices.columns), nonnegative)
+    with stage("Frontier: solve"):
+        if risk_aversions is not None:
+            parameter_name, parameters = "risk_aversion", np.asarray(risk_aversions, dtype=np.float64)
+            weights = solver.solve_risk_aversions(cov, mean, parameters)
+        else:
+            parameter_name = "target_return"
+            parameters, weights = solver.solve_targets(cov, mean, n_points)
+
+    with np.errstate(invalid="ignore"):
+        expected_return = weights @ mean
+        volatility = np.sqrt(np.clip(np.einsum("ij,jk,ik->i", weights, cov, weights), 0, None))
+    return {
+        "weights": pd.DataFrame(weights, columns=prices.columns),
+        "points": pd.DataFrame({
+            parameter_name: parameters,
+            "expected_return": expected_return,
+            "volatility": volatility,
+        }),
+    }
+
+
+class FrontierSolver:
+    """
+    Efficient-frontier problems built once per asset count and re-solved for every point.
+
+    Without the nonnegativity constraint every frontier point is a combination of the two
+    vectors inv(cov) @ 1 and inv(cov) @ mean, so the whole frontier comes from one Cholesky
+    factorization and two triangular solves, vectorized over the points. With it, two DPP
+    problems (target return, and risk aversion through a pre-scaled mean parameter) are
+    canonicalized once; the Cholesky factor is set once per frontier and the points are solved
+    in order, each warm-started from the previous one. Mean and covariance are rescaled to
+    unit size before solving so SCS's tolerances are meaningful for daily-scale returns.
+    """
+
+    def __init__(self, n_assets, nonnegative=True):
+        self.n_assets = n_assets
+        self.nonnegative = nonnegative
+        self._lock = threading.Lock()
+        if nonnegative:
+            import cvxpy as cp
+            self._chol_upper = cp.Parameter((n_assets, n_assets))
+            self._mean = cp.Parameter(n_assets)
+            self._target = cp.Parameter()
+            self._scaled_mean = cp.Parameter(n_assets)
+            self._w = cp.Variable(n_assets)
+            risk = cp.sum_squares(self._chol_upper @ self._w)
+            budget = [cp.sum(self._w) == 1, self._w >= 0]
+            self._target_problem = cp.Problem(cp.Minimize(risk), budget + [self._mean @ self._w >= self._target])
+            # mean' w - gamma / 2 * w' cov w is maximized by minimizing w' cov w - (2 / gamma) mean' w.
+            self._aversion_problem = cp.Problem(cp.Minimize(risk - self._scaled_mean @ self._w), budget)
+
+    def _prepare(self, cov, mean):
+        """Scale factors and the Cholesky factor of the rescaled covariance (None if it fails)."""
+        cov_scale = max(np.trace(cov) / len(cov), 1e-12)
+        mean_scale = max(np.abs(mean).max(), 1e-12)
+        factor = MeanVarianceSolver._cholesky(cov / cov_scale)
+        return cov_scale, mean_scale, factor
+
+    def _solve_points(self, problem, set_point, points):
+        import cvxpy as cp
+        weights = np.full((len(points), self.n_assets), np.nan)
+        for k, point in enumerate(points):
+            set_point(point)
+            try:
+                problem.solve(solver=cp.SCS, warm_start=True)
+            except cp.error.SolverError:
+                record_solve("solver_error")
+                record_fallback("Frontier: solver failed")
+                continue
+            stats = problem.solver_stats
+            record_solve(problem.status, stats.num_iters, stats.solve_time)
+            if self._w.value is not None and problem.status in ("optimal", "optimal_inaccurate"):
+                weights[k] = self._w.value
+            else:
+                record_fallback("Frontier: solver failed")
+        return weights
+
+    def solve_targets(self, cov, mean, n_points):
+        """Return (target returns, weights matrix) for n_points targets from the minimum-variance return up."""
+        cov_scale, mean_scale, factor = self._prepare(cov, mean)
+        if factor is None:
+            return np.full(n_points, np.nan), np.full((n_points, self.n_assets), np.nan)
+        scaled_mean = mean / mean_scale
+
+        if not self.nonnegative:
+            inv_ones = cho_solve(factor, np.ones(self.n_assets))
+            inv_mean = cho_solve(factor, scaled_mean)
+            a, b, c = inv_ones.sum(), inv_mean.sum(), scaled_mean @ inv_mean
+            d = a * c - b ** 2
+            min_var_return = b / a
+            targets = np.linspace(min_var_return, max(scaled_mean.max(), min_var_return), n_points)
+            if d <= 0:
+                # Mean proportional to the budget vector: the frontier collapses to one point.
+                return targets * mean_scale, np.tile(inv_ones / a, (n_points, 1))
+            weights = (np.outer((c - targets * b) / d, inv_ones) + np.outer((targets * a - b) / d, inv_mean))
+            return targets * mean_scale, weights
+
+        with self._lock:
+            self._chol_upper.value = np.tril(factor[0]).T
+            self._mean.value = scaled_mean
+            # Minimum-variance point first (the target is not binding at the lowest mean).
+            min_var = self._solve_points(self._target_problem, self._set_target, [scaled_mean.min()])[0]
+            min_var_return = scaled_mean @ min_var if np.isfinite(min_var).all() else scaled_mean.min()
+            targets = np.linspace(min_var_return, max(scaled_mean.max(), min_var_return), n_points)
+            weights = np.vstack([min_var, self._solve_points(self._target_problem, self._set_target, targets[1:])])
+        return targets * mean_scale, weights
+
+    def solve_risk_aversions(self, cov, mean, risk_aversions):
+        """Return the weights matrix maximizing mean' w - gamma / 2 * w' cov w for each gamma."""
+        cov_scale, mean_scale, factor = self._prepare(cov, mean)
+        n_points = len(risk_aversions)
+        if factor is None:
+            return np.full((n_points, self.n_assets), np.nan)
+        scaled_mean = mean / mean_scale
+        # gamma on the original scale corresponds to gamma * cov_scale / mean_scale after rescaling.
+        scaled_aversions = np.asarray(risk_aversions, dtype=np.float64) * cov_scale / mean_scale
+
+        if not self.nonnegative:
+            inv_ones = cho_solve(factor, np.ones(self.n_assets))
+            inv_mean = cho_solve(factor, scaled_mean)
+            a, b = inv_ones.sum(), inv_mean.sum()
+            with np.errstate(divide="ignore"):
+                tilt = 1 / scaled_aversions
+            return inv_ones / a + np.outer(tilt, inv_mean - (b / a) * inv_ones)
+
+        with self._lock:
+            self._chol_upper.value = np.tril(factor[0]).T
+            # Solve from the most to the least risk-averse point so warm starts move along the frontier.
+            order = np.argsort(-scaled_aversions)
+            weights = np.empty((n_points, self.n_assets))
+            weights[order] = self._solve_points(
+                self._aversion_problem,
+                lambda gamma: setattr(self._scaled_mean, "value", 2 / gamma * scaled_mean),
+                scaled_aversions[order],
+            )
+        return weights
+
+    def _set_target(self, target):
+        self._target.value = target
+
+
+_frontier_solvers = {}
+
+
+def get_frontier_solver(n_assets, nonnegative=True):
+    """Return the shared FrontierSolver for this problem shape, building it on first use."""
+    key = (n_assets, bool(nonnegative))
+    with _mvo_solvers_lock:
+        if key not in _frontier_solvers:
+            _frontier_solvers[key] = FrontierSolver(n_assets, nonnegative)
+        return _frontier_solvers[key]
+
+
+# === Optimizer Registry ===
+# Maps each method name shown in the app to a callable taking (prices, **options).
+# Options a method doesn't use (e.g. nonnegative_mvo for HRP) are ignored. The optional
+# "estimate" option is a shared covariance estimate for the window (see covariance.py).
+OPTIMIZERS = {
+    "Equal Weight": lambda prices, **options: equal_weight(prices),
+    "Mean Variance": lambda prices, nonnegative_mvo=True, estimate=None, **options: mean_variance_opt(
+        prices, nonnegative=nonnegative_mvo, estimate=estimate),
+    "HRB": lambda prices, linkage_method="single", estimate=None, **options: hrp(
+        prices, linkage_method=linkage_method, estimate=estimate),
+}
+
+
+def _halflife_in_bars(prices, halflife, halflife_bars=None):
+    """
+    EWMA half-life in rows of prices: halflife_bars if given, otherwise halflife (in days)
+    converted with the bar length of the window's index.
+    """
+    if halflife_bars is not None or halflife is None:
+        return halflife_bars
+    from utils import bar_timedelta  # utils imports this module
+    return halflife * (pd.Timedelta(days=1) / bar_timedelta(prices.index))
+
+
+def run_optimizer(prices, method, nonnegative_mvo=True, cov_method="sample", halflife=None, halflife_bars=None,
+                  **options):
+    """
+    Run a single optimization method by name and return its weights.
+    cov_method selects the covariance estimator ("sample" or "ewma" with the given halflife in days,
+    converted to bars from the spacing of prices' index unless halflife_bars is given).
+    """
+    if method not in OPTIMIZERS:
+        raise ValueError(f"Unknown optimization method: {method!r}. Available: {list(OPTIMIZERS)}")
+    if cov_method != "sample" and options.get("estimate") is None:
+        options["estimate"] = window_estimate(prices.pct_change().dropna(), cov_method,
+                                              _halflife_in_bars(prices, halflife, halflife_bars))
+    return OPTIMIZERS[method](prices, nonnegative_mvo=nonnegative_mvo, **options)
+
+
+# === Optimizer Wrapper ===
+def run_optimizers(prices, nonnegative_mvo=True, methods=None, cov_method="sample", halflife=None, halflife_bars=None,
+                   **options):
+    """Run the requested methods (all registered methods by default) on the same price window."""
+    if methods is None:
+        methods = list(OPTIMIZERS)
+    halflife_bars = _halflife_in_bars(prices, halflife, halflife_bars)
+    if "estimate" not in options and (len(methods) > 1 or cov_method != "sample"):
+        # Estimate the covariance once and hand it to every method.
+        options["estimate"] = window_estimate(prices.pct_change().dropna(), cov_method, halflife_bars)
+    return {
+        method: run_optimizer(prices, method, nonnegative_mvo=nonnegative_mvo, cov_method=cov_method, halflife=halflife,
+                              halflife_bars=halflife_bars, **options)
+        for method in methods
+    }
@@ -0,0 +1,166 @@
+# optimizer_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from optimizer import OPTIMIZERS, run_optimizer
+
+# Options derived from the window itself (and therefore already covered by the hash).
+# An EWMA estimate also depends on history before the window, so it is hashed separately.
+_DERIVED_OPTIONS = ("estimate",)
+
+# Salt of every cache key. Bump it whenever a change to optimizer.py (or the covariance
+# estimates it is given) changes the weights an optimizer returns, so entries stored by
+# earlier code are no longer served.
+CACHE_VERSION = 2
+
+
+# === Persistent Optimizer Cache ===
+class OptimizerCache:
+    """
+    Content-addressed on-disk cache of optimizer results.
+
+    Entries are keyed by a hash of the lookback window's price values, the asset set,
+    the method and the optimizer options (e.g. nonnegative_mvo), and stored in a local
+    SQLite file so overlapping backtests reuse earlier solves across sessions and app
+    restarts. The total stored size is bounded with least-recently-used eviction.
+    """
+
+    def __init__(self, path="Data/optimizer_cache.sqlite", max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def __getstate__(self):
+        # Connections can't be pickled; worker processes reopen the file on first use.
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS optimizer_results ("
+                "key TEXT PRIMARY KEY, assets TEXT NOT NULL, weights BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON optimizer_results (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def window_key(prices, method, **optimizer_kwargs):
+        """Hash of the cache version, window values, asset set, method and optimizer options."""
+        values = np.ascontiguousarray(prices.to_numpy(dtype=np.float64))
+        digest = hashlib.sha256()
+        digest.update(f"optimizer-cache-v{CACHE_VERSION}".encode())
+        digest.update(str(values.shape).encode())
+        digest.update(values.tobytes())
+        digest.update(json.dumps([str(c) for c in prices.columns]).encode())
+        options = sorted((k, v) for k, v in optimizer_kwargs.items() if k not in _DERIVED_OPTIONS)
+        digest.update(json.dumps([method, options], default=str).encode())
+        estimate = optimizer_kwargs.get("estimate")
+        if estimate is not None and optimizer_kwargs.get("cov_method", "sample") != "sample":
+            digest.update(np.ascontiguousarray(estimate["cov"]).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT assets, weights FROM optimizer_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE optimizer_results SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+        assets, blob = row
+        return pd.Series(np.frombuffer(blob, dtype=np.float64).copy(), index=json.loads(assets))
+
+    def put(self, key, weights):
+        blob = np.ascontiguousarray(weights.to_numpy(dtype=np.float64)).tobytes()
+        assets = json.dumps([str(c) for c in weights.index])
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO optimizer_results (key, assets, weights, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, assets, blob, len(blob) + len(assets), time.time()),
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM optimizer_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM optimizer_results ORDER BY last_access"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM optimizer_results WHERE key = ?", stale_keys)
+
+    def run_optimizer(self, prices, method, **optimizer_kwargs):
+        """Cached equivalent of optimizer.run_optimizer."""
+        key = self.window_key(prices, method, **optimizer_kwargs)
+        weights = self.get(key)
+        if weights is None:
+            weights = run_optimizer(prices, method, **optimizer_kwargs)
+            self.put(key, weights)
+        return weights
+
+    def run_optimizers(self, prices, methods=None, **optimizer_kwargs):
+        """Cached equivalent of optimizer.run_optimizers."""
+        if methods is None:
+            methods = list(OPTIMIZERS)
+        return {method: self.run_optimizer(prices, method, **optimizer_kwargs) for method in methods}
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current on-disk footprint."""
+        with self._lock:
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM optimizer_results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else np.nan,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM optimizer_results")
+            conn.commit()
+        self.reset_stats()
@@ -1,12 +1,95 @@
 import altair as alt
+import numpy as np
 import pandas as pd
 
+from universe import dense_allocations
+
+# Charts are ~700px wide; more points than that per series only inflate the Vega-Lite payload.
+MAX_POINTS = 700
+# Altair's default row limit for a single chart's data.
+MAX_ROWS = 5000
+# Fewest points downsample_positions keeps per series (the min and max of a single bucket).
+MIN_POINTS = 2
+
+
+def points_per_series(n_series):
+    """
+    Per-series point budget so a chart with n_series lines stays within MAX_ROWS. The budget
+    never drops below MIN_POINTS, so this holds for up to MAX_ROWS // MIN_POINTS series.
+    """
+    return max(MIN_POINTS, min(MAX_POINTS, MAX_ROWS // max(n_series, 1)))
+
+
+def downsample_positions(values, max_points=MAX_POINTS):
+    """
+    Row positions to keep per column of a 2-D array (rows = dates) when drawing it as lines.
+
+    The rows are split into max_points // 2 equal buckets and, for each column, the minimum and
+    maximum of every bucket are kept (in time order), so peaks and drawdown troughs survive the
+    downsampling. Returns an int array of shape (n_kept, n_columns), or all rows if there are
+    no more than max_points.
+    """
+    n_rows, n_cols = values.shape
+    if n_rows <= max_points:
+        return np.repeat(np.arange(n_rows)[:, None], n_cols, axis=1)
+
+    n_buckets = max(max_points // 2, 1)
+    bucket_size = -(-n_rows // n_buckets)
+    n_buckets = -(-n_rows // bucket_size)
+    padded = np.full((n_buckets * bucket_size, n_cols), np.nan)
+    padded[:n_rows] = values
+    buckets = padded.reshape(n_buckets, bucket_size, n_cols)
+
+    offsets = np.arange(n_buckets)[:, None] * bucket_size
+    lows = np.where(np.isnan(buckets), np.inf, buckets).argmin(axis=1) + offsets
+    highs = np.where(np.isnan(buckets), -np.inf, buckets).argmax(axis=1) + offsets
+    positions = np.sort(np.stack([lows, highs], axis=1), axis=1).reshape(-1, n_cols)
+    # The padded tail of the last bucket can only be picked if it is entirely NaN.
+    return np.minimum(positions, n_rows - 1)
+
+
+def long_frame(index, values, labels, value_name, label_name, max_points=None):
+    """
+    Long-format ("date", label_name, value_name) frame for a wide array of series sharing an
+    index, downsampled per series with downsample_positions (by default to the budget from
+    points_per_series). Built with NumPy instead of reset_index/melt/concat.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if max_points is None:
+        max_points = points_per_series(values.shape[1])
+    positions = downsample_positions(values, max_points)
+    columns = np.broadcast_to(np.arange(values.shape[1]), positions.shape)
+    return pd.DataFrame({
+        "date": pd.Index(index)[positions.ravel(order="F")],
+        label_name: np.repeat(np.asarray(labels, dtype=object), positions.shape[0]),
+        value_name: values[positions, columns].ravel(order="F"),
+    })
+
+
+def concat_long_frames(frames, value_name, label_name):
+    """Stack long frames with identical columns by concatenating their arrays."""
+    if not frames:
+        return pd.DataFrame(columns=["date", label_name, value_name])
+    return pd.DataFrame({
+        column: np.concatenate([f[column].to_numpy() for f in frames])
+        for column in ["date", label_name, value_name]
+    })
+
+
+def long_frame_from_series(series_by_label, value_name, label_name, max_points=None, offset=0.0):
+    """long_frame for a dict of Series that may have different indexes (e.g. one per method)."""
+    if max_points is None:
+        max_points = points_per_series(len(series_by_label))
+    frames = [
+        long_frame(series.index, series.to_numpy(dtype=np.float64)[:, None] + offset, [label], value_name, label_name, max_points)
+        for label, series in series_by_label.items()
+    ]
+    return concat_long_frames(frames, value_name, label_name)
+
 def plot_allocations_per_method(allocations, method):
-    # allocations: DataFrame with date as index and asset columns for one method.
-    df_reset = allocations.reset_index()
-    date_column = df_reset.columns[0]
-    alloc_df = df_reset.melt(id_vars=date_column, var_name="Asset", value_name="Allocation")
-    alloc_df = alloc_df.rename(columns={date_column: "date"})
+    # allocations: DataFrame with date as index and asset columns for one method (or SparseAllocations).
+    allocations = dense_allocations(allocations)
+    alloc_df = long_frame(allocations.index, allocations.to_numpy(dtype=np.float64), allocations.columns, "Allocation", "Asset")
     chart = alt.Chart(alloc_df).mark_line().encode(
         x="date:T",
         y=alt.Y("Allocation:Q", title="Allocation"),
@@ -31,15 +114,10 @@ def pie_chart_allocation(initial_weights, method):
 
 
 def plot_cumulative_returns(results_dict):
-    cumul_df_list = []
-    for method, res in results_dict.items():
-        temp = res["cumulative"].reset_index()
-        temp.columns = ["date", "cumulative"]
-        # Adjust cumulative returns to start at 0 (subtract 1)
-        temp["cumulative"] = temp["cumulative"] - 1
-        temp["Method"] = method
-        cumul_df_list.append(temp)
-    cumul_df = pd.concat(cumul_df_list)
+    # Adjust cumulative returns to start at 0 (subtract 1)
+    cumul_df = long_frame_from_series(
+        {method: res["cumulative"] for method, res in results_dict.items()}, "cumulative", "Method", offset=-1.0
+    )
     chart = alt.Chart(cumul_df).mark_line().encode(
         x="date:T",
         y=alt.Y("cumulative:Q", title="Cumulative Return (starting at 0)"),
@@ -47,29 +125,42 @@ def plot_cumulative_returns(results_dict):
     ).properties(width=700, height=400, title="Cumulative Returns by Optimization Method")
     return chart
 
-def plot_rolling_sharpe(results_dict):
-    sharpe_df_list = []
-    for method, res in results_dict.items():
-        temp = res["rolling_sharpe"].reset_index()
-        temp.columns = ["date", "rolling_sharpe"]
-        temp["Method"] = method
-        sharpe_df_list.append(temp)
-    sharpe_df = pd.concat(sharpe_df_list)
-    chart = alt.Chart(sharpe_df).mark_line().encode(
+ROLLING_METRIC_TITLES = {
+    "sharpe": "Rolling Annualized Sharpe Ratio",
+    "sortino": "Rolling Annualized Sortino Ratio",
+    "volatility": "Rolling Annualized Volatility",
+    "max_drawdown": "Rolling Maximum Drawdown",
+    "calmar": "Rolling Calmar Ratio",
+}
+
+
+def plot_rolling_metric(metrics_frame, metric):
+    # metrics_frame: long frame from metrics.rolling_metrics, where every (method, window) series
+    # is a contiguous block on the same dates, so one metric reshapes to a (dates x series) array.
+    rows = (metrics_frame["metric"] == metric).to_numpy()
+    selected = metrics_frame.loc[rows]
+    series = selected[["Method", "window"]].drop_duplicates()
+    n_dates = len(selected) // max(len(series), 1)
+    values = selected["value"].to_numpy().reshape(len(series), n_dates).T
+    metric_df = long_frame(selected["date"].to_numpy()[:n_dates], values, np.arange(len(series)), metric, "series")
+    n_kept = len(metric_df) // max(len(series), 1)
+    metric_df["Method"] = np.repeat(series["Method"].astype(str).to_numpy(), n_kept)
+    metric_df["Window"] = np.repeat(series["window"].to_numpy(), n_kept)
+    title = ROLLING_METRIC_TITLES.get(metric, metric)
+    chart = alt.Chart(metric_df).mark_line().encode(
         x="date:T",
-        y=alt.Y("rolling_sharpe:Q", title="Rolling Annualized Sharpe Ratio"),
-        color="Method:N"
-    ).properties(width=700, height=400, title="Rolling Annualized Sharpe Ratio")
+        y=alt.Y(f"{metric}:Q", title=title),
+        color="Method:N",
+        strokeDash=alt.StrokeDash("Window:O", title="Window (bars)"),
+        detail="series:N",
+        tooltip=["date:T", "Method:N", "Window:O", alt.Tooltip(f"{metric}:Q", format=".2f")]
+    ).properties(width=700, height=400, title=title)
     return chart
 
 def plot_drawdowns(results_dict):
-    drawdown_df_list = []
-    for method, res in results_dict.items():
-        temp = res["drawdowns"].reset_index()
-        temp.columns = ["date", "drawdown"]
-        temp["Method"] = method
-        drawdown_df_list.append(temp)
-    drawdown_df = pd.concat(drawdown_df_list)
+    drawdown_df = long_frame_from_series(
+        {method: res["drawdowns"] for method, res in results_dict.items()}, "drawdown", "Method"
+    )
     chart = alt.Chart(drawdown_df).mark_line().encode(
         x="date:T",
         y=alt.Y("drawdown:Q", title="Rolling Maximum Drawdown"),
@@ -77,21 +168,62 @@ def plot_drawdowns(results_dict):
     ).properties(width=700, height=400, title="Rolling Maximum Drawdown")
     return chart
 
+
+def plot_cumulative_costs(results_dict):
+    # Running total of trading costs (fraction of portfolio value) for methods simulated with costs.
+    costs_df = long_frame_from_series(
+        {method: res["costs"].cumsum() for method, res in results_dict.items() if "costs" in res}, "costs", "Method"
+    )
+    chart = alt.Chart(costs_df).mark_line().encode(
+        x="date:T",
+        y=alt.Y("costs:Q", title="Cumulative Trading Costs", axis=alt.Axis(format="%")),
+        color="Method:N",
+        tooltip=["date:T", "Method:N", alt.Tooltip("costs:Q", format=".2%")]
+    ).properties(width=700, height=400, title="Cumulative Trading Costs by Optimization Method")
+    return chart
+
+
+def plot_efficient_frontier(frontier, asset_stats=None, portfolio_stats=None, periods_per_year=365):
+    # frontier: result of optimizer.efficient_frontier. asset_stats / portfolio_stats: optional
+    # DataFrames indexed by name with per-bar "expected_return" and "volatility", drawn as points.
+    def annualized(stats):
+        return pd.DataFrame({
+            "Volatility": stats["volatility"].to_numpy() * np.sqrt(periods_per_year),
+            "Return": stats["expected_return"].to_numpy() * periods_per_year,
+        })
+
+    frontier_df = annualized(frontier["points"]).assign(point=np.arange(len(frontier["points"])))
+    chart = alt.Chart(frontier_df.dropna()).mark_line(point=True).encode(
+        x=alt.X("Volatility:Q", title="Annualized Volatility", axis=alt.Axis(format="%")),
+        y=alt.Y("Return:Q", title="Annualized Expected Return", axis=alt.Axis(format="%")),
+        order="point:Q",
+        tooltip=[alt.Tooltip("Volatility:Q", format=".2%"), alt.Tooltip("Return:Q", format=".2%")]
+    )
+    layers = [chart]
+    for stats, label, shape in [(asset_stats, "Asset", "circle"), (portfolio_stats, "Portfolio", "diamond")]:
+        if stats is None or stats.empty:
+            continue
+        points_df = annualized(stats).assign(**{label: stats.index.astype(str)})
+        layers.append(alt.Chart(points_df).mark_point(shape=shape, size=80, filled=True).encode(
+            x="Volatility:Q",
+            y="Return:Q",
+            color=alt.Color(f"{label}:N"),
+            tooltip=[f"{label}:N", alt.Tooltip("Volatility:Q", format=".2%"), alt.Tooltip("Return:Q", format=".2%")]
+        ))
+    return alt.layer(*layers).resolve_scale(color="independent").properties(
+        width=700, height=400, title="Efficient Frontier (Lookback Window)"
+    )
+
 def plot_allocations(results_dict):
-    alloc_df_list = []
-    for method, res in results_dict.items():
-        # Reset the index; this will add a column for the dates.
-        df_reset = res["allocations"].reset_index()
-        # Use the first column name as the date column.
-        date_column = df_reset.columns[0]
-        # Melt the DataFrame using that column as id_vars.
-        alloc_df = df_reset.melt(id_vars=date_column, var_name="Asset", value_name="Allocation")
-        # Rename the date column to "date" for consistency.
-        alloc_df = alloc_df.rename(columns={date_column: "date"})
-        alloc_df["Method"] = method
-        alloc_df_list.append(alloc_df)
-    alloc_df_all = pd.concat(alloc_df_list)
-    alloc_df_all["Method_Asset"] = alloc_df_all["Method"] + " - " + alloc_df_all["Asset"]
+    allocations = {method: dense_allocations(res["allocations"]) for method, res in results_dict.items()}
+    max_points = points_per_series(sum(alloc.shape[1] for alloc in allocations.values()))
+    alloc_df_all = concat_long_frames([
+        long_frame(
+            alloc.index, alloc.to_numpy(dtype=np.float64),
+            [f"{method} - {asset}" for asset in alloc.columns], "Allocation", "Method_Asset", max_points
+        )
+        for method, alloc in allocations.items()
+    ], "Allocation", "Method_Asset")
     
     chart = alt.Chart(alloc_df_all).mark_line().encode(
         x="date:T",
@@ -103,9 +235,9 @@ def plot_allocations(results_dict):
 
 def plot_asset_returns(simulation_data, selected_assets):
     # Filter data to selected assets and compute daily returns (%)
-    data_filtered = simulation_data[selected_assets].copy()
+    data_filtered = simulation_data[selected_assets]
     returns = data_filtered.pct_change() * 100
-    returns = returns.reset_index().melt(id_vars="date", var_name="Asset", value_name="Daily Return (%)")
+    returns = long_frame(returns.index, returns.to_numpy(dtype=np.float64), selected_assets, "Daily Return (%)", "Asset")
     chart = alt.Chart(returns).mark_line().encode(
          x="date:T",
          y=alt.Y("Daily Return (%):Q", title="Daily Return (%)"),
@@ -115,7 +247,8 @@ def plot_asset_returns(simulation_data, selected_assets):
 
 def plot_asset_prices(simulation_data, selected_assets, log_scale=False):
     # Plot absolute prices for the selected assets.
-    data_filtered = simulation_data[selected_assets].reset_index().melt(id_vars="date", var_name="Asset", value_name="Price")
+    data_filtered = simulation_data[selected_assets]
+    data_filtered = long_frame(data_filtered.index, data_filtered.to_numpy(dtype=np.float64), selected_assets, "Price", "Asset")
     scale_type = "log" if log_scale else "linear"
     chart = alt.Chart(data_filtered).mark_line().encode(
          x="date:T",
@@ -123,3 +256,20 @@ def plot_asset_prices(simulation_data, selected_assets, log_scale=False):
          color="Asset:N"
     ).properties(width=700, height=400, title="Asset Prices")
     return chart
+
+def plot_sweep_heatmap(sweep_df, metric="sharpe"):
+    # sweep_df: tidy output of utils.sweep_backtests, one row per configuration and method.
+    title = "Annualized Sharpe Ratio" if metric == "sharpe" else "Maximum Drawdown"
+    value_format = ".2f" if metric == "sharpe" else ".2%"
+    df = sweep_df.copy()
+    df["Config"] = df["method"] + df["nonnegative"].map({True: "", False: " (long/short)"})
+    chart = alt.Chart(df).mark_rect().encode(
+        x=alt.X("rebalance_days:O", title="Rebalance Every N Days"),
+        y=alt.Y("lookback_days:O", title="Lookback (days)"),
+        color=alt.Color(f"{metric}:Q", title=title, scale=alt.Scale(scheme="redyellowgreen")),
+        tooltip=["Config:N", "lookback_days:O", "rebalance_days:O",
+                 alt.Tooltip("sharpe:Q", format=".2f"), alt.Tooltip("max_drawdown:Q", format=".2%")]
+    ).properties(width=250, height=250).facet(
+        column=alt.Column("Config:N", title=None)
+    ).properties(title=f"{title} by Lookback and Rebalance Period")
+    return chart
@@ -0,0 +1,226 @@
+# price_store.py
+import glob
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+# === Date-Partitioned Price Store ===
+# The merged price file is written with one Parquet row group per calendar year, so date-range
+# reads only touch the row groups they need, and a small JSON sidecar holds the column list and
+# date bounds so the app can build its widgets without loading any prices.
+# Incremental appends write their new dates to small part files in a <name>_parts folder next to
+# the base file instead of rewriting it; readers treat the base file and its parts as one table,
+# and compact_prices folds the parts back into the base file once in a while.
+
+def metadata_path_for(path):
+    """Location of the metadata sidecar kept next to a price file."""
+    return os.path.splitext(path)[0] + "_meta.json"
+
+
+def parts_dir_for(path):
+    """Folder holding the appended part files of a price file."""
+    return os.path.splitext(path)[0] + "_parts"
+
+
+def price_files(path):
+    """The base price file followed by its part files, in append order."""
+    return [path] + sorted(glob.glob(os.path.join(parts_dir_for(path), "part-*.parquet")))
+
+
+def _index_column(parquet_file):
+    """Name of the column pandas stored the date index in."""
+    pandas_metadata = parquet_file.schema_arrow.pandas_metadata or {}
+    for index_column in pandas_metadata.get("index_columns", []):
+        if isinstance(index_column, str):
+            return index_column
+    return "date"
+
+
+def write_prices(prices, path):
+    """
+    Write a wide price DataFrame (datetime index) with one row group per year, plus its sidecar.
+    Each year is converted to Arrow separately, so only one year is ever copied at a time.
+    """
+    if not prices.index.is_monotonic_increasing:
+        prices = prices.sort_index()
+    years = prices.index.year
+    boundaries = _year_boundaries(years)
+    schema = pa.Schema.from_pandas(prices, preserve_index=True)
+    # A full rewrite replaces any appended parts.
+    shutil.rmtree(parts_dir_for(path), ignore_errors=True)
+    with pq.ParquetWriter(path, schema) as writer:
+        for lo, hi in zip(boundaries[:-1], boundaries[1:]):
+            writer.write_table(pa.Table.from_pandas(prices.iloc[lo:hi], schema=schema, preserve_index=True))
+    write_metadata(path)
+
+
+def _year_boundaries(years):
+    years = list(years)
+    return [0] + [i for i in range(1, len(years)) if years[i] != years[i - 1]] + [len(years)]
+
+
+def write_part(table, path):
+    """
+    Append a table of new dates (with the base file's schema) as the next part file of a price
+    file, then refresh the sidecar. The part is written under a temporary name and renamed into
+    place, so readers never see it half written. Returns the part's file name.
+    """
+    parts_dir = parts_dir_for(path)
+    os.makedirs(parts_dir, exist_ok=True)
+    parts = price_files(path)[1:]
+    number = int(os.path.basename(parts[-1])[5:-8]) + 1 if parts else 1
+    name = f"part-{number:05d}.parquet"
+    tmp_path = os.path.join(parts_dir, f"{name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, os.path.join(parts_dir, name))
+    write_metadata(path)
+    return name
+
+
+def compact_prices(path):
+    """
+    Fold the part files back into the base price file. Only the base file's last row group
+    (the year the parts continue) and the parts are re-read; they are rewritten one row group
+    per year after the untouched earlier row groups.
+    """
+    parts = price_files(path)[1:]
+    if not parts:
+        return
+    parquet_file = pq.ParquetFile(path)
+    schema = parquet_file.schema_arrow
+    index_column = _index_column(parquet_file)
+    last = parquet_file.num_row_groups - 1
+    tail = pa.concat_tables([parquet_file.read_row_group(last)] + [pq.read_table(part, schema=schema) for part in parts])
+    boundaries = _year_boundaries(pc.year(tail.column(index_column)).to_numpy(zero_copy_only=False))
+
+    tmp_path = path + ".tmp"
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for i in range(last):
+            writer.write_table(parquet_file.read_row_group(i))
+        for lo, hi in zip(boundaries[:-1], boundaries[1:]):
+            writer.write_table(tail.slice(lo, hi - lo))
+    parquet_file.close()
+    os.replace(tmp_path, path)
+    shutil.rmtree(parts_dir_for(path), ignore_errors=True)
+    write_metadata(path)
+
+
+def write_metadata(path):
+    """
+    (Re)build the sidecar from the Parquet footers of the base file and its parts: column list,
+    date bounds, row count, and the parts and modification times it was built from.
+    """
+    files = price_files(path)
+    parquet_file = pq.ParquetFile(path)
+    index_column = _index_column(parquet_file)
+    index_pos = parquet_file.schema_arrow.get_field_index(index_column)
+    index_type = parquet_file.schema_arrow.field(index_column).type
+    footers = [parquet_file.metadata] + [pq.read_metadata(part) for part in files[1:]]
+
+    # Date bounds from row-group statistics, falling back to reading just the index column.
+    stats = [footer.row_group(i).column(index_pos).statistics for footer in footers for i in range(footer.num_row_groups)]
+    if stats and all(s is not None and s.has_min_max for s in stats):
+        start, end = min(s.min for s in stats), max(s.max for s in stats)
+    else:
+        index = pq.read_table(files, columns=[index_column]).column(index_column).to_pandas()
+        start, end = index.min(), index.max()
+
+    tz = getattr(index_type, "tz", None)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if tz is not None:
+        start = start.tz_localize("UTC").tz_convert(tz) if start.tzinfo is None else start.tz_convert(tz)
+        end = end.tz_localize("UTC").tz_convert(tz) if end.tzinfo is None else end.tz_convert(tz)
+
+    metadata = {
+        "columns": [name for name in parquet_file.schema_arrow.names if name != index_column],
+        "index_column": index_column,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "tz": tz,
+        "rows": sum(footer.num_rows for footer in footers),
+        "row_groups": sum(footer.num_row_groups for footer in footers),
+        "parts": [os.path.basename(part) for part in files[1:]],
+        "mtime": max(os.path.getmtime(file) for file in files),
+    }
+    # Write to a per-process temp file and swap it in, so concurrent readers (e.g. the batch CLI's
+    # workers) never see a partially written sidecar.
+    sidecar = metadata_path_for(path)
+    tmp_path = f"{sidecar}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, sidecar)
+    return metadata
+
+
+def _read_sidecar(path):
+    """The sidecar's metadata if it matches the price files' parts, footers and mtimes, else None."""
+    try:
+        with open(metadata_path_for(path)) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+    files = price_files(path)
+    if metadata.get("parts") != [os.path.basename(part) for part in files[1:]]:
+        return None
+    footers = [pq.read_metadata(file) for file in files]
+    if (metadata.get("mtime") != max(os.path.getmtime(file) for file in files)
+            or metadata.get("rows") != sum(footer.num_rows for footer in footers)
+            or metadata.get("row_groups") != sum(footer.num_row_groups for footer in footers)):
+        return None
+    return metadata
+
+
+def load_metadata(path):
+    """
+    Column list and date bounds of a price file without loading any prices. Reads the sidecar,
+    rebuilding it from the Parquet footers if it is missing, unreadable, or doesn't match the
+    price files (its recorded parts, mtime, row count or row-group count differ from theirs).
+    """
+    metadata = _read_sidecar(path)
+    if metadata is None:
+        metadata = write_metadata(path)
+    metadata["start"] = pd.Timestamp(metadata["start"])
+    metadata["end"] = pd.Timestamp(metadata["end"])
+    return metadata
+
+
+def load_prices(path, columns=None, start=None, end=None):
+    """
+    Read only the requested columns for the date range [start, end] (inclusive). The date
+    filter is pushed down to Parquet so row groups (and part files) outside the range are
+    skipped, and the files are memory-mapped.
+    """
+    parquet_file = pq.ParquetFile(path)
+    index_column = _index_column(parquet_file)
+    tz = getattr(parquet_file.schema_arrow.field(index_column).type, "tz", None)
+
+    def to_filter_value(timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        if tz is not None:
+            timestamp = timestamp.tz_localize(tz) if timestamp.tzinfo is None else timestamp.tz_convert(tz)
+        elif timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert(None)
+        return timestamp
+
+    filters = []
+    if start is not None:
+        filters.append((index_column, ">=", to_filter_value(start)))
+    if end is not None:
+        filters.append((index_column, "<=", to_filter_value(end)))
+
+    read_columns = None if columns is None else list(columns) + [index_column]
+    files = price_files(path)
+    table = pq.read_table(files if len(files) > 1 else path, columns=read_columns, filters=filters or None,
+                          memory_map=True, schema=parquet_file.schema_arrow if len(files) > 1 else None)
+    prices = table.to_pandas()
+    if index_column in prices.columns:
+        prices = prices.set_index(index_column)
+    if columns is not None:
+        prices = prices[list(columns)]
+    return prices.sort_index()
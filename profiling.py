@@ -0,0 +1,135 @@
+# profiling.py
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+# === Stage Profiler ===
+# Lightweight timing hooks for the backtest hot path. Code marks its stages with
+# `with stage("name"):` and reports solver results and equal-weight fallbacks; all of these
+# are no-ops unless a Profiler has been activated with `profiling()` in the current context,
+# so uninstrumented runs only pay for a ContextVar lookup.
+
+_active_profiler = ContextVar("active_profiler", default=None)
+
+
+class Profiler:
+    """Collects time per stage, per-rebalance times, solver statistics and fallback counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}         # stage name -> [total seconds, calls]
+        self.rebalances = []     # (rebalance date, seconds)
+        self.solves = []         # {"status", "iterations", "solve_time"} per solver call
+        self.fallbacks = {}      # reason -> count
+        self.started = time.perf_counter()
+        self.total_seconds = None
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def add_rebalance(self, date, seconds):
+        with self._lock:
+            self.rebalances.append((date, seconds))
+
+    def add_solve(self, status, iterations=None, solve_time=None):
+        with self._lock:
+            self.solves.append({"status": status, "iterations": iterations, "solve_time": solve_time})
+
+    def add_fallback(self, reason):
+        with self._lock:
+            self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+
+    def stop(self):
+        self.total_seconds = time.perf_counter() - self.started
+
+    def summary(self):
+        """
+        Structured profile: total seconds, {stage: {"seconds", "calls"}}, per-rebalance times,
+        solver status counts and iteration statistics, and fallback counts by reason.
+        """
+        total = self.total_seconds if self.total_seconds is not None else time.perf_counter() - self.started
+        iterations = [s["iterations"] for s in self.solves if s["iterations"] is not None]
+        statuses = {}
+        for solve in self.solves:
+            statuses[solve["status"]] = statuses.get(solve["status"], 0) + 1
+        return {
+            "total_seconds": total,
+            "stages": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.stages.items()},
+            "rebalances": pd.Series(
+                [seconds for _, seconds in self.rebalances],
+                index=pd.Index([date for date, _ in self.rebalances], name="date"),
+                name="seconds", dtype=float,
+            ),
+            "solver": {
+                "solves": len(self.solves),
+                "status_counts": statuses,
+                "mean_iterations": sum(iterations) / len(iterations) if iterations else None,
+                "max_iterations": max(iterations) if iterations else None,
+                "solve_seconds": sum(s["solve_time"] or 0.0 for s in self.solves),
+            },
+            "fallbacks": dict(self.fallbacks),
+        }
+
+
+@contextmanager
+def profiling():
+    """Activate a new Profiler for the enclosed code and yield it."""
+    profiler = Profiler()
+    token = _active_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active_profiler.reset(token)
+
+
+def active_profiler():
+    """The Profiler collecting in the current context, or None."""
+    return _active_profiler.get()
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block under the given stage name."""
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add_time(name, time.perf_counter() - started)
+
+
+def record_solve(status, iterations=None, solve_time=None):
+    """Record one solver call's status and iteration count."""
+    profiler = _active_profiler.get()
+    if profiler is not None:
+        profiler.add_solve(status, iterations, solve_time)
+
+
+def record_fallback(reason):
+    """Count a fallback to equal (or previous) weights."""
+    profiler = _active_profiler.get()
+    if profiler is not None:
+        profiler.add_fallback(reason)
+
+
+def stage_table(profile):
+    """Breakdown table of a profile summary: seconds, calls, mean ms per call and share of the total."""
+    rows = [
+        {"stage": name, "seconds": entry["seconds"], "calls": entry["calls"],
+         "ms_per_call": 1000 * entry["seconds"] / entry["calls"] if entry["calls"] else 0.0}
+        for name, entry in profile["stages"].items()
+    ]
+    table = pd.DataFrame(rows, columns=["stage", "seconds", "calls", "ms_per_call"])
+    total = profile["total_seconds"]
+    table["share"] = table["seconds"] / total if total else 0.0
+    return table.sort_values("seconds", ascending=False).reset_index(drop=True)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def daily_returns():
+    """Three series of random daily returns."""
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2021-01-01", periods=400, freq="D")
+    return pd.DataFrame(rng.normal(0.0005, 0.03, (400, 3)), index=index, columns=["A", "B", "C"])
+
+
+@pytest.fixture
+def daily_prices(daily_returns):
+    """Price paths built from daily_returns."""
+    return 100 * (1 + daily_returns).cumprod()
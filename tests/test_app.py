@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from price_store import write_prices
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    """Working directory with a small merged price file where the app expects it."""
+    rng = np.random.default_rng(2)
+    index = pd.date_range("2021-01-01", periods=240, freq="D", name="date")
+    prices = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.0005, 0.03, (240, 6)), axis=0), index=index,
+                          columns=[f"COIN{j}" for j in range(6)])
+    prices.iloc[:60, 4:] = prices.iloc[60, 4:].to_numpy()  # two coins listed later (backfilled)
+    (tmp_path / "Data").mkdir()
+    write_prices(prices, str(tmp_path / "Data" / "prices.parquet"))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def run_backtest(at):
+    next(button for button in at.button if button.label == "Optimize Portfolio").click()
+    at.run()
+    assert not at.exception
+    assert not at.error
+    return [markdown.value for markdown in at.markdown]
+
+
+def test_backtest_runs(app_dir):
+    at = AppTest.from_file(APP_PATH, default_timeout=300)
+    at.run()
+    assert "### Summary Metrics by Method" in run_backtest(at)
+
+
+def test_top_n_universe_with_default_dates(app_dir):
+    # The default range starts at the first date, so the initial lookback window has a single row.
+    at = AppTest.from_file(APP_PATH, default_timeout=300)
+    at.run()
+    next(box for box in at.sidebar.checkbox if box.label.startswith("Dynamic Top-N")).check()
+    at.run()
+    next(number for number in at.sidebar.number_input if number.label.startswith("Assets Held")).set_value(3)
+    at.run()
+    markdowns = run_backtest(at)
+    assert "### Initial Allocations (Pie Charts)" in markdowns
+    assert "### Summary Metrics by Method" in markdowns
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from optimizer import run_optimizer
+from utils import dynamic_backtest_portfolios, parse_period
+
+
+def reference_backtest(prices, method, lookback_days, rebalance_days, nonnegative_flag):
+    """The original per-rebalance pandas loop of dynamic_backtest_portfolio."""
+    returns = prices.pct_change().dropna()
+    dates = returns.index
+    weight_df = pd.DataFrame(index=dates, columns=prices.columns)
+
+    for i in range(0, len(dates), rebalance_days):
+        rebal_date = dates[i]
+        lookback_start = rebal_date - pd.Timedelta(days=lookback_days)
+        lookback_data = prices.loc[lookback_start:rebal_date]
+        end_idx = min(i + rebalance_days, len(dates))
+
+        lookback_returns = lookback_data.pct_change().dropna()
+        asset_stds = lookback_returns.std()
+        valid_assets = asset_stds[asset_stds > 0].index.tolist()
+        if len(valid_assets) == 0:
+            if i > 0:
+                weight_df.iloc[i:end_idx] = weight_df.iloc[i - 1].values
+            else:
+                weight_df.iloc[i:end_idx] = pd.Series(1 / len(prices.columns), index=prices.columns).values
+            continue
+
+        new_weights = run_optimizer(lookback_data[valid_assets], method, nonnegative_mvo=nonnegative_flag)
+        new_weights = new_weights.reindex(prices.columns).fillna(0)
+        if new_weights.sum() > 0:
+            new_weights /= new_weights.sum()
+        elif i > 0:
+            new_weights = weight_df.iloc[i - 1]
+        else:
+            new_weights = pd.Series(1 / len(prices.columns), index=prices.columns)
+        weight_df.iloc[i:end_idx] = new_weights.values
+
+    weight_df = weight_df.ffill().fillna(0).astype(np.float64)
+    portfolio_returns = (returns * weight_df).sum(axis=1)
+    cumulative = (1 + portfolio_returns).cumprod()
+    rolling_sharpe = np.sqrt(365) * portfolio_returns.rolling(30).mean() / portfolio_returns.rolling(30).std()
+    drawdowns = cumulative / cumulative.cummax() - 1
+    daily_std = portfolio_returns.std()
+    return {
+        "cumulative": cumulative,
+        "rolling_sharpe": rolling_sharpe,
+        "drawdowns": drawdowns,
+        "allocations": weight_df,
+        "sharpe": np.sqrt(365) * (portfolio_returns.mean() / daily_std) if daily_std > 0 else np.nan,
+        "drawdown": drawdowns.min(),
+    }
+
+
+@pytest.fixture
+def prices(daily_prices):
+    prices = daily_prices.copy()
+    prices["D"] = prices["A"].iloc[150]  # listed late: backfilled flat, then moving
+    prices.loc[prices.index[150]:, "D"] = prices["A"].iloc[150:] * 0.5
+    prices["E"] = 7.0  # never moves, never valid
+    return prices
+
+
+@pytest.mark.parametrize("lookback_days, rebalance_days", [(30, 7), (90, 30), (10, 1)])
+def test_backtest_matches_reference_loop(prices, lookback_days, rebalance_days):
+    methods = ["Equal Weight", "HRB"]
+    results = dynamic_backtest_portfolios(prices, methods, lookback_days, rebalance_days, True)
+    for method in methods:
+        expected = reference_backtest(prices, method, lookback_days, rebalance_days, True)
+        result = results[method]
+        # The rolling Sharpe ratio comes from cumulative sums, so it is compared in absolute terms.
+        for key, atol in [("cumulative", 1e-13), ("drawdowns", 1e-13), ("rolling_sharpe", 1e-12)]:
+            np.testing.assert_allclose(result[key].to_numpy(), expected[key].to_numpy(), rtol=0, atol=atol)
+            assert result[key].index.equals(expected[key].index)
+        allocations = result["allocations"].reindex(columns=prices.columns)
+        np.testing.assert_allclose(allocations.to_numpy(), expected["allocations"].to_numpy(), rtol=0, atol=1e-13)
+        assert result["sharpe"] == pytest.approx(expected["sharpe"], rel=1e-12)
+        assert result["drawdown"] == pytest.approx(expected["drawdown"], rel=1e-12)
+
+
+@pytest.mark.parametrize("period, default_unit, expected", [
+    ("288 bars", "days", ("bars", 288)),
+    ("1 bar", "days", ("bars", 1)),
+    (" 12 Bars ", "days", ("bars", 12)),
+    ("6h", "bars", ("time", pd.Timedelta(hours=6))),
+    ("90D", "bars", ("time", pd.Timedelta(days=90))),
+    (pd.Timedelta(minutes=5), "bars", ("time", pd.Timedelta(minutes=5))),
+    (30, "days", ("time", pd.Timedelta(days=30))),
+    (np.int64(7), "bars", ("bars", 7)),
+    (1.5, "days", ("time", pd.Timedelta(hours=36))),
+])
+def test_parse_period(period, default_unit, expected):
+    assert parse_period(period, default_unit) == expected
+
+
+@pytest.mark.parametrize("period, default_unit", [(0, "days"), (0, "bars"), (-3, "bars"), ("0 bars", "days"),
+                                                  ("-2h", "bars"), ("0D", "bars")])
+def test_parse_period_rejects_non_positive(period, default_unit):
+    with pytest.raises(ValueError, match="must be positive"):
+        parse_period(period, default_unit)
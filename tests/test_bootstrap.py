@@ -0,0 +1,24 @@
+import numpy as np
+
+from bootstrap import bootstrap_metrics, chunk_paths, confidence_intervals
+
+
+def test_chunk_size_follows_memory_budget():
+    assert chunk_paths(1000, 3, max_bytes=10 ** 6) == 10 ** 6 // (1000 * (5 * 8 + 4 * 8 * 3))
+    # Longer histories get fewer paths per chunk, never fewer than one.
+    assert chunk_paths(50_000, 3, max_bytes=10 ** 6) < chunk_paths(1000, 3, max_bytes=10 ** 6)
+    assert chunk_paths(10 ** 7, 10, max_bytes=10 ** 6) == 1
+
+
+def test_results_do_not_depend_on_workers(daily_returns):
+    serial = bootstrap_metrics(daily_returns, n_paths=300, chunk_size=100)
+    parallel = bootstrap_metrics(daily_returns, n_paths=300, chunk_size=100, max_workers=2)
+    for column in daily_returns.columns:
+        np.testing.assert_array_equal(serial[column].to_numpy(), parallel[column].to_numpy())
+
+
+def test_budgeted_chunks_cover_all_paths(daily_returns):
+    distributions = bootstrap_metrics(daily_returns, n_paths=250, max_chunk_bytes=2 * 10 ** 6)
+    assert all(len(distribution) == 250 for distribution in distributions.values())
+    ci = confidence_intervals(distributions["A"], 0.9)
+    assert (ci["lower"] <= ci["median"]).all() and (ci["median"] <= ci["upper"]).all()
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.covariance import LedoitWolf
+
+from covariance import EWMACovariance, RollingCovariance, window_estimate
+
+
+@pytest.fixture
+def returns():
+    rng = np.random.default_rng(4)
+    mixing = rng.normal(size=(8, 8)) / 3 + np.eye(8)
+    return rng.normal(0.001, 0.02, (300, 8)) @ mixing
+
+
+def assert_matches_window(estimate, window):
+    """Compare an estimate with numpy's sample statistics and sklearn's LedoitWolf on window."""
+    np.testing.assert_allclose(estimate["cov"], np.cov(window, rowvar=False), rtol=1e-10, atol=1e-16)
+    np.testing.assert_allclose(estimate["corr"], np.corrcoef(window, rowvar=False), rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(estimate["mean"], window.mean(axis=0), rtol=1e-10, atol=1e-16)
+    np.testing.assert_allclose(estimate["shrunk_cov"], LedoitWolf().fit(window).covariance_, rtol=1e-9, atol=1e-16)
+    assert estimate["n_obs"] == len(window)
+
+
+def test_full_window_matches_ledoit_wolf(returns):
+    assert_matches_window(window_estimate(returns[:90]), returns[:90])
+
+
+def test_asset_subset_matches_ledoit_wolf(returns):
+    estimator = RollingCovariance(returns.shape[1])
+    estimator.add(returns[:90])
+    idx = np.array([1, 4, 5, 7])
+    # Shrinkage depends on the assets included, so the subset estimate is a fit on those columns only.
+    assert_matches_window(estimator.estimate(idx), returns[:90, idx])
+
+
+def test_sliding_window_matches_refit(returns):
+    window, step = 60, 7
+    estimator = RollingCovariance(returns.shape[1])
+    estimator.add(returns[:window])
+    for lo in range(step, len(returns) - window, step):
+        estimator.remove(returns[lo - step:lo])
+        estimator.add(returns[lo + window - step:lo + window])
+        assert_matches_window(estimator.estimate(), returns[lo:lo + window])
+    assert_matches_window(estimator.estimate(np.array([0, 2])), returns[lo:lo + window, [0, 2]])
+
+
+def test_fewer_than_two_rows_gives_no_estimate(returns):
+    estimator = RollingCovariance(returns.shape[1])
+    estimator.add(returns[:1])
+    assert estimator.estimate() is None
+
+
+def ewma_by_row(rows, halflife):
+    """Reference EWMA: the documented per-row recursion, seeded with the first row."""
+    alpha = 1 - 0.5 ** (1 / halflife)
+    mean, cov = rows[0].copy(), np.zeros((rows.shape[1], rows.shape[1]))
+    for x in rows[1:]:
+        d = x - mean
+        mean = mean + alpha * d
+        cov = (1 - alpha) * (cov + alpha * np.outer(d, d))
+    return mean, cov
+
+
+@pytest.mark.parametrize("chunks", [[300], [1, 299], [50, 1, 120, 129], [7] * 42 + [6]])
+def test_ewma_block_update_matches_row_recursion(returns, chunks):
+    halflife = 20
+    estimator = EWMACovariance(returns.shape[1], halflife)
+    for lo, hi in zip(np.cumsum([0] + chunks[:-1]), np.cumsum(chunks)):
+        estimator.add(returns[lo:hi])
+    mean, cov = ewma_by_row(returns, halflife)
+    assert estimator.count == len(returns)
+    np.testing.assert_allclose(estimator.mean, mean, rtol=1e-10, atol=1e-16)
+    np.testing.assert_allclose(estimator.cov, cov, rtol=1e-10, atol=1e-18)
+
+
+def test_ewma_matches_pandas(returns):
+    halflife = 10
+    estimate = window_estimate(returns, "ewma", halflife)
+    frame = pd.DataFrame(returns)
+    expected = frame.ewm(halflife=halflife, adjust=False).cov(bias=True).loc[len(frame) - 1].to_numpy()
+    np.testing.assert_allclose(estimate["cov"], expected, rtol=1e-10, atol=1e-18)
+    np.testing.assert_allclose(estimate["mean"], frame.ewm(halflife=halflife, adjust=False).mean().iloc[-1], rtol=1e-10)
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import dynamic_backtest_portfolio
+
+
+@pytest.fixture
+def many_prices():
+    """60 assets, so equal weights (1/60) are smaller than a 2% no-trade band."""
+    rng = np.random.default_rng(1)
+    index = pd.date_range("2021-01-01", periods=200, freq="D")
+    returns = rng.normal(0.0005, 0.02, (200, 60))
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=index, columns=[f"C{j}" for j in range(60)])
+
+
+@pytest.mark.parametrize("top_n", [None, 60])
+def test_band_wider_than_target_weights_still_invests_from_cash(many_prices, top_n):
+    result = dynamic_backtest_portfolio(many_prices, "Equal Weight", 30, 7, True, no_trade_band=0.02, fee_bps=10,
+                                        top_n=top_n)
+    assert np.isfinite(result["cumulative"]).all()
+    assert result["turnover"].iloc[0] == pytest.approx(1.0)
+    assert result["costs"].iloc[0] == pytest.approx(1e-3)
+    # Equal weights drift but never move by more than the band, so nothing trades after the first bar.
+    assert result["turnover"].iloc[1:].sum() == pytest.approx(0.0, abs=1e-12)
+
+
+def test_drift_without_costs_matches_buy_and_hold(daily_prices):
+    result = dynamic_backtest_portfolio(daily_prices, "Equal Weight", 30, len(daily_prices), True, drift=True)
+    expected = (daily_prices.iloc[1:] / daily_prices.iloc[0]).mean(axis=1)
+    np.testing.assert_allclose(result["cumulative"].to_numpy(), expected.to_numpy(), rtol=1e-12)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.cluster.hierarchy import leaves_list, linkage
+
+from covariance import window_estimate
+from optimizer import HRP_LINKAGE_METHODS, hrp
+
+
+def recursive_hrp(prices):
+    """The original pandas implementation of HRP (single linkage, recursive bisection)."""
+    returns = prices.pct_change().dropna()
+    returns = returns.dropna(axis=1, how='any')
+    returns = returns.loc[:, returns.std() > 0]
+    if returns.shape[1] < 2:
+        n = len(prices.columns)
+        return pd.Series([1/n]*n, index=prices.columns)
+
+    corr = returns.corr()
+    dist = np.sqrt(0.5 * (1 - corr))
+    condensed_dist = dist.values[np.triu_indices_from(dist, k=1)]
+    linkage_matrix = linkage(condensed_dist, method='single')
+    sort_ix = leaves_list(linkage_matrix)
+    sorted_assets = returns.columns[sort_ix]
+
+    def get_cluster_var(cov, assets):
+        sub_cov = cov.loc[assets, assets]
+        weights = np.ones(len(assets)) / len(assets)
+        return weights @ sub_cov @ weights
+
+    def recursive_weights(cov, assets):
+        if len(assets) == 1:
+            return pd.Series([1], index=assets)
+        split = len(assets) // 2
+        left = assets[:split]
+        right = assets[split:]
+        left_var = get_cluster_var(cov, left)
+        right_var = get_cluster_var(cov, right)
+        alloc = 1 - left_var / (left_var + right_var)
+        return pd.concat([
+            recursive_weights(cov, left) * alloc,
+            recursive_weights(cov, right) * (1 - alloc)
+        ])
+
+    cov = returns.cov()
+    weights = recursive_weights(cov, sorted_assets)
+    return weights.reindex(prices.columns).fillna(0)
+
+
+def random_window(seed, n_assets, n_days=90, constant=()):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.001, 0.03, (n_days, n_assets)) * rng.uniform(0.5, 2, n_assets)
+    prices = pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), columns=[f"C{j}" for j in range(n_assets)])
+    for j in constant:
+        prices.iloc[:, j] = 100.0
+    return prices
+
+
+WINDOWS = [(0, 2, ()), (1, 7, ()), (2, 16, ()), (3, 33, ()), (4, 12, (5,)), (5, 9, (0, 8))]
+
+
+@pytest.mark.parametrize("seed, n_assets, constant", WINDOWS)
+def test_single_linkage_matches_recursive_hrp(seed, n_assets, constant):
+    prices = random_window(seed, n_assets, constant=constant)
+    expected = recursive_hrp(prices)
+    np.testing.assert_allclose(hrp(prices).to_numpy(), expected.to_numpy(), rtol=0, atol=1e-15)
+
+    # The backtest passes a shared covariance estimate instead of the prices' returns.
+    estimate = window_estimate(prices.pct_change().dropna())
+    np.testing.assert_allclose(hrp(prices, estimate=estimate).to_numpy(), expected.to_numpy(), rtol=0, atol=1e-14)
+
+
+@pytest.mark.parametrize("linkage_method", [method for method in HRP_LINKAGE_METHODS if method != "single"])
+def test_other_linkages_give_valid_weights(linkage_method):
+    prices = random_window(6, 15, constant=(3,))
+    weights = hrp(prices, linkage_method=linkage_method)
+    assert list(weights.index) == list(prices.columns)
+    assert np.isfinite(weights).all() and (weights >= 0).all()
+    assert weights.sum() == pytest.approx(1.0)
+    assert weights["C3"] == 0
+
+
+def test_unknown_linkage_is_rejected():
+    with pytest.raises(ValueError, match="Unknown HRP linkage method"):
+        hrp(random_window(0, 3), linkage_method="median")
@@ -0,0 +1,110 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import merge_price_data as merge_price_data_module
+from merge_price_data import append_price_data, forward_fill, manifest_path_for, merge_price_data
+from price_store import load_metadata, load_prices, price_files
+
+
+@pytest.mark.parametrize("block_bytes", [1, 100, 2 ** 20])
+def test_forward_fill_matches_pandas(block_bytes):
+    rng = np.random.default_rng(3)
+    values = rng.normal(size=(50, 4))
+    values[rng.random(values.shape) < 0.4] = np.nan
+    values[:5, 0] = np.nan  # leading NaNs stay NaN
+    expected = pd.DataFrame(values).ffill().to_numpy()
+    filled = forward_fill(values, block_bytes)
+    assert filled is values
+    np.testing.assert_array_equal(values, expected)
+
+
+def write_coin(root, coin, dates, close):
+    (root / coin).mkdir()
+    table = pa.table({"date": pd.DatetimeIndex(dates), "close": np.log10(close) / 10})
+    pq.write_table(table, str(root / coin / f"{coin}_USD.parquet"))
+
+
+def test_merge_backfills_and_forward_fills(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    write_coin(raw, "AAA", pd.date_range("2021-12-30", periods=5, freq="D"), [1.0, 2.0, 3.0, 4.0, 5.0])
+    write_coin(raw, "BBB", ["2022-01-01", "2022-01-03"], [10.0, 30.0])
+    output = str(tmp_path / "prices.parquet")
+    merge_price_data(str(raw), output, max_workers=2)
+
+    prices = load_prices(output)
+    assert pq.ParquetFile(output).num_row_groups == 2  # one per year
+    np.testing.assert_allclose(prices["AAA"].to_numpy(), [1, 2, 3, 4, 5])
+    np.testing.assert_allclose(prices["BBB"].to_numpy(), [10, 10, 10, 10, 30])
+
+
+def write_history(root, n_days):
+    """Rewrite two coins' raw files with n_days of history (BBB trades every other day)."""
+    dates = pd.date_range("2021-12-20", periods=n_days, freq="D")
+    for coin, close, keep in [("AAA", 1.0 + np.arange(n_days), slice(None)), ("BBB", 50.0 + np.arange(n_days), slice(None, None, 2))]:
+        (root / coin).mkdir(parents=True, exist_ok=True)
+        path = root / coin / f"{coin}_USD.parquet"
+        pq.write_table(pa.table({"date": dates[keep], "close": np.log10(close[keep]) / 10}), str(path))
+        os.utime(path, (0, n_days))  # distinct mtime per rewrite
+
+
+def test_append_writes_parts_and_compacts(tmp_path, monkeypatch):
+    monkeypatch.setattr(merge_price_data_module, "MAX_PARTS", 3)
+    raw = tmp_path / "raw"
+    output = str(tmp_path / "prices.parquet")
+    write_history(raw, 10)
+    merge_price_data(str(raw), output)
+    base_size = os.path.getsize(output)
+
+    for n_parts, n_days in [(1, 13), (2, 17)]:
+        write_history(raw, n_days)
+        append_price_data(str(raw), output)
+        # The base file is untouched; the new dates go to part files listed in the manifest.
+        assert os.path.getsize(output) == base_size
+        assert len(price_files(output)) == 1 + n_parts
+        with open(manifest_path_for(output)) as f:
+            assert len(json.load(f)["parts"]) == n_parts
+
+        expected_path = str(tmp_path / f"expected{n_days}.parquet")
+        merge_price_data(str(raw), expected_path)
+        pd.testing.assert_frame_equal(load_prices(output), load_prices(expected_path))
+        assert load_metadata(output)["end"] == load_metadata(expected_path)["end"]
+        assert load_metadata(output)["rows"] == n_days
+
+    # The third part reaches MAX_PARTS and is folded back into the base file, one row group per year.
+    write_history(raw, 20)
+    append_price_data(str(raw), output)
+    assert price_files(output) == [output]
+    with open(manifest_path_for(output)) as f:
+        assert json.load(f)["parts"] == []
+    assert pq.ParquetFile(output).num_row_groups == 2
+    merge_price_data(str(raw), str(tmp_path / "expected20.parquet"))
+    pd.testing.assert_frame_equal(load_prices(output), load_prices(str(tmp_path / "expected20.parquet")))
+    assert load_prices(output, start="2022-01-05", end="2022-01-06")["BBB"].tolist() == pytest.approx([66.0, 66.0])
+
+
+def test_append_replaces_forward_filled_rows_of_a_lagging_coin(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    output = str(tmp_path / "prices.parquet")
+    dates = pd.date_range("2022-01-01", periods=12, freq="D")
+    write_coin(raw, "AAA", dates[:10], np.arange(10.0) + 1)
+    write_coin(raw, "BBB", dates[:8], np.arange(8.0) + 10)
+    merge_price_data(str(raw), output)
+
+    # BBB catches up: its rows for days 9-10 replace the forward-filled placeholders.
+    for coin, start in [("AAA", 1.0), ("BBB", 10.0)]:
+        path = raw / coin / f"{coin}_USD.parquet"
+        pq.write_table(pa.table({"date": dates, "close": np.log10(np.arange(12.0) + start) / 10}), str(path))
+        os.utime(path, (0, 1))
+    append_price_data(str(raw), output)
+
+    prices = load_prices(output)
+    np.testing.assert_allclose(prices["AAA"].to_numpy(), np.arange(12.0) + 1)
+    np.testing.assert_allclose(prices["BBB"].to_numpy(), np.arange(12.0) + 10)
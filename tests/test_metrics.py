@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from metrics import ROLLING_METRICS, rolling_metric_arrays, rolling_metrics
+
+
+def brute_force_max_drawdown(returns, window):
+    """Per-window (w / w.cummax() - 1).min() of the window's own wealth path."""
+    out = pd.Series(np.nan, index=returns.index)
+    for end in range(window, len(returns) + 1):
+        wealth = (1 + returns.iloc[end - window:end]).cumprod()
+        out.iloc[end - 1] = (wealth / wealth.cummax() - 1).min()
+    return out
+
+
+@pytest.mark.parametrize("window", [2, 5, 30, 90])
+def test_max_drawdown_matches_brute_force(daily_returns, window):
+    arrays = rolling_metric_arrays(daily_returns.to_numpy(), [window], ["max_drawdown"])
+    for j, column in enumerate(daily_returns.columns):
+        expected = brute_force_max_drawdown(daily_returns[column], window)
+        np.testing.assert_allclose(arrays[("max_drawdown", window)][:, j], expected.to_numpy(), atol=1e-12)
+
+
+def test_calmar_uses_in_window_drawdown(daily_returns):
+    window = 30
+    arrays = rolling_metric_arrays(daily_returns.to_numpy(), [window], ["calmar"], periods_per_year=365)
+    returns = daily_returns["A"]
+    annual_return = np.expm1(np.log1p(returns).rolling(window).sum() * 365 / window)
+    expected = annual_return / -brute_force_max_drawdown(returns, window)
+    np.testing.assert_allclose(arrays[("calmar", window)][:, 0], expected.to_numpy(), rtol=1e-9)
+
+
+def test_moment_metrics_match_pandas(daily_returns):
+    window = 30
+    arrays = rolling_metric_arrays(daily_returns.to_numpy(), [window], ["sharpe", "volatility"], periods_per_year=365)
+    rolling = daily_returns.rolling(window)
+    np.testing.assert_allclose(arrays[("volatility", window)], (rolling.std() * np.sqrt(365)).to_numpy(), rtol=1e-8)
+    np.testing.assert_allclose(arrays[("sharpe", window)],
+                               (np.sqrt(365) * rolling.mean() / rolling.std()).to_numpy(), rtol=1e-8)
+
+
+def test_rolling_metrics_layout(daily_returns):
+    frame = rolling_metrics(daily_returns, windows=[7, 30])
+    assert len(frame) == len(ROLLING_METRICS) * 2 * 3 * len(daily_returns)
+    block = frame.iloc[:len(daily_returns)]
+    assert (block["Method"] == "A").all() and (block["window"] == 7).all()
+    assert (block["metric"] == ROLLING_METRICS[0]).all()
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from covariance import window_estimate
+from optimizer import mean_variance_opt, run_optimizer, run_optimizers
+
+
+@pytest.fixture
+def hourly_prices():
+    rng = np.random.default_rng(5)
+    index = pd.date_range("2024-01-01", periods=240, freq="h")
+    returns = rng.normal(0, 0.01, (240, 4)) * np.array([1, 2, 3, 4]) + rng.normal(0, 0.01, (240, 1))
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=index, columns=list("ABCD"))
+
+
+def test_ewma_halflife_is_converted_from_days_to_bars(hourly_prices):
+    # A one-day half-life on hourly bars is a 24-bar EWMA (closed-form MVO, so weights compare exactly).
+    estimate = window_estimate(hourly_prices.pct_change().dropna(), "ewma", 24)
+    expected = mean_variance_opt(hourly_prices, nonnegative=False, estimate=estimate)
+    daily = run_optimizer(hourly_prices, "Mean Variance", cov_method="ewma", halflife=1, nonnegative_mvo=False)
+    np.testing.assert_allclose(daily.to_numpy(), expected.to_numpy(), atol=1e-10)
+    combined = run_optimizers(hourly_prices, methods=["Mean Variance", "HRB"], cov_method="ewma", halflife=1,
+                              nonnegative_mvo=False)
+    np.testing.assert_allclose(combined["Mean Variance"].to_numpy(), expected.to_numpy(), atol=1e-10)
+
+    # An explicit half-life in bars takes precedence over the index spacing.
+    by_bars = run_optimizer(hourly_prices, "Mean Variance", cov_method="ewma", halflife=1, halflife_bars=24,
+                            nonnegative_mvo=False)
+    np.testing.assert_allclose(by_bars.to_numpy(), expected.to_numpy(), atol=1e-10)
+    one_bar_estimate = window_estimate(hourly_prices.pct_change().dropna(), "ewma", 1)
+    one_bar = mean_variance_opt(hourly_prices, nonnegative=False, estimate=one_bar_estimate)
+    assert not np.allclose(daily.to_numpy(), one_bar.to_numpy(), atol=1e-6)
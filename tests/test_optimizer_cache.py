@@ -0,0 +1,19 @@
+import optimizer_cache
+from optimizer_cache import OptimizerCache
+
+
+def test_window_key_depends_on_cache_version(daily_prices, monkeypatch):
+    window = daily_prices.iloc[:60]
+    key = OptimizerCache.window_key(window, "HRB", nonnegative_mvo=True)
+    assert OptimizerCache.window_key(window, "HRB", nonnegative_mvo=True) == key
+    monkeypatch.setattr(optimizer_cache, "CACHE_VERSION", optimizer_cache.CACHE_VERSION + 1)
+    assert OptimizerCache.window_key(window, "HRB", nonnegative_mvo=True) != key
+
+
+def test_cached_weights_match_optimizer(daily_prices, tmp_path):
+    cache = OptimizerCache(str(tmp_path / "cache.sqlite"))
+    window = daily_prices.iloc[:60]
+    first = cache.run_optimizer(window, "HRB")
+    second = cache.run_optimizer(window, "HRB")
+    assert cache.stats()["hits"] == 1
+    assert (first == second).all()
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from plots import MAX_ROWS, MIN_POINTS, long_frame, plot_allocations, plot_asset_prices, points_per_series
+
+
+@pytest.mark.parametrize("n_series", [1, 7, 83, 84, 150, 1000, MAX_ROWS // MIN_POINTS])
+def test_point_budget_fits_row_limit(n_series):
+    index = pd.date_range("2015-01-01", periods=3000, freq="D")
+    values = np.random.default_rng(n_series).normal(size=(3000, n_series)).cumsum(axis=0)
+    frame = long_frame(index, values, np.arange(n_series), "value", "series")
+    assert n_series * points_per_series(n_series) <= MAX_ROWS
+    assert len(frame) <= MAX_ROWS
+
+
+def test_many_assets_stay_within_altair_limit():
+    index = pd.date_range("2015-01-01", periods=3000, freq="D")
+    prices = pd.DataFrame(np.random.default_rng(0).uniform(1, 2, (3000, 150)), index=index,
+                          columns=[f"C{j}" for j in range(150)])
+    chart = plot_asset_prices(prices, list(prices.columns))
+    assert len(chart.data) <= MAX_ROWS
+    chart.to_dict()  # raises MaxRowsError above the limit
+
+    allocations = {method: {"allocations": prices / prices.sum(axis=1).to_numpy()[:, None]} for method in ("A", "B")}
+    chart = plot_allocations(allocations)
+    assert len(chart.data) <= MAX_ROWS
+    chart.to_dict()
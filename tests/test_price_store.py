@@ -0,0 +1,47 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from price_store import load_metadata, load_prices, metadata_path_for, write_prices
+
+
+@pytest.fixture
+def price_path(tmp_path):
+    index = pd.date_range("2021-12-01", periods=60, freq="D", name="date")
+    prices = pd.DataFrame({"A": np.arange(60.0) + 1, "B": np.arange(60.0) + 100}, index=index)
+    path = str(tmp_path / "prices.parquet")
+    write_prices(prices, path)
+    return path
+
+
+def test_metadata_from_sidecar(price_path):
+    metadata = load_metadata(price_path)
+    assert metadata["columns"] == ["A", "B"]
+    assert metadata["start"] == pd.Timestamp("2021-12-01") and metadata["end"] == pd.Timestamp("2022-01-29")
+    assert metadata["rows"] == 60 and metadata["row_groups"] == 2
+    assert not [name for name in os.listdir(os.path.dirname(price_path)) if name.endswith(".tmp")]
+
+
+def test_stale_sidecar_is_rebuilt(price_path):
+    # A sidecar left over from a different file (e.g. an interrupted rewrite) is not trusted,
+    # even though it is newer than the price file.
+    sidecar = metadata_path_for(price_path)
+    with open(sidecar) as f:
+        metadata = json.load(f)
+    metadata.update(rows=10, end="2021-12-10T00:00:00")
+    with open(sidecar, "w") as f:
+        json.dump(metadata, f)
+    assert load_metadata(price_path)["end"] == pd.Timestamp("2022-01-29")
+
+    with open(sidecar, "w") as f:
+        f.write('{"columns": [')  # truncated
+    assert load_metadata(price_path)["rows"] == 60
+
+
+def test_load_prices_date_range(price_path):
+    prices = load_prices(price_path, columns=["B"], start="2021-12-31", end="2022-01-02")
+    assert list(prices.columns) == ["B"]
+    np.testing.assert_array_equal(prices["B"].to_numpy(), [130.0, 131.0, 132.0])
@@ -0,0 +1,139 @@
+# universe.py
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# === Dynamic Universe ===
+# For large coin universes only a few dozen assets are investable at any date. merge_price_data
+# backfills each coin's leading NaNs with its first price, so a coin that wasn't listed yet
+# shows up as a flat price run. The dynamic-universe backtest treats an asset as listed from its
+# first real price, and at each rebalance picks the top N eligible assets (listed for the whole
+# lookback window and allowed by an optional precomputed eligibility mask, e.g. volume above
+# a threshold) ranked by a liquidity score. Allocations are then kept sparse.
+
+
+def listing_rows(values):
+    """
+    Row of each column's first real price in a (rows x assets) price array: the last row of
+    its leading run of identical (backfilled) prices, or the first non-NaN row if it has no
+    backfill. Columns that never change price get len(values).
+    """
+    values = np.asarray(values)
+    n_rows = len(values)
+    if n_rows < 2:
+        return np.where(np.isnan(values).all(axis=0), n_rows, 0)
+    with np.errstate(invalid="ignore"):
+        changed = (values[1:] != values[:-1]) & ~np.isnan(values[1:]) & ~np.isnan(values[:-1])
+    first_change = np.where(changed.any(axis=0), changed.argmax(axis=0), n_rows)
+    # A column that starts with NaNs (not backfilled) is listed from its first valid price.
+    valid = ~np.isnan(values)
+    first_valid = np.where(valid.any(axis=0), valid.argmax(axis=0), n_rows)
+    return np.minimum(first_change, np.where(first_valid > 0, first_valid, n_rows))
+
+
+def listing_dates(prices):
+    """Date of each asset's first real price (NaT if its price never changes), see listing_rows."""
+    rows = listing_rows(prices.to_numpy(dtype=np.float64))
+    dates = prices.index.append(pd.DatetimeIndex([pd.NaT]))[rows]
+    return pd.Series(dates, index=prices.columns, name="listing_date")
+
+
+def listing_mask(prices, min_history=None):
+    """
+    Precomputed listing mask: True where an asset has been listed (for at least min_history,
+    a Timedelta or offset string, if given). Combine it with liquidity masks such as
+    `volume.rolling("30D").mean() > 1e6` to build the eligibility mask of a dynamic universe.
+    """
+    listed = listing_dates(prices)
+    if min_history is not None:
+        listed = listed + pd.Timedelta(min_history)
+    dates = prices.index.to_numpy()[:, None]
+    return pd.DataFrame(dates >= listed.to_numpy()[None, :], index=prices.index, columns=prices.columns)
+
+
+def top_n_assets(candidates, top_n, scores, listed_rows):
+    """
+    Positions of the top_n candidate assets, ranked by score (highest first), then by earlier
+    listing and column order. Returned in column order, so the selection is always sliced the
+    same way as the full universe.
+    """
+    candidates = np.asarray(candidates, dtype=np.intp)
+    if len(candidates) <= top_n:
+        return candidates
+    order = np.lexsort((candidates, listed_rows[candidates], -scores[candidates]))
+    return np.sort(candidates[order[:top_n]])
+
+
+def window_universe(prices, top_n):
+    """
+    Columns of the top_n assets for a single lookback window of prices, chosen like a rebalance
+    of the dynamic-universe backtest without a liquidity score: real prices over the whole
+    window and varying returns, ranked by the number of bars the price moved.
+    """
+    values = prices.to_numpy(dtype=np.float64)
+    returns = values[1:] / values[:-1] - 1
+    moves = (returns != 0).sum(axis=0).astype(np.float64)
+    listed = listing_rows(values)
+    candidates = np.flatnonzero((listed == 0) & (np.nanstd(returns, axis=0) > 0)) if len(returns) > 1 else []
+    return prices.columns[top_n_assets(candidates, top_n, moves, listed)]
+
+
+# === Sparse Allocations ===
+class SparseAllocations:
+    """
+    Allocation history stored as CSR rows of weights (rows x assets), plus the row each bar uses.
+
+    Without drift the weights are constant between rebalances, so there is one row per
+    rebalance; in drift mode there is one row per bar. Either way only the assets actually held
+    are stored. to_dense() expands to the DataFrame layout of a dense backtest on demand.
+    """
+
+    def __init__(self, matrix, bar_rows, index, columns):
+        self.matrix = sparse.csr_array(matrix)
+        self.bar_rows = np.asarray(bar_rows, dtype=np.intp)
+        self.index = index
+        self.columns = pd.Index(columns)
+
+    @classmethod
+    def from_rows(cls, rows, bar_rows, index, columns, dtype=np.float64):
+        """Build from a list of (asset positions, weights) pairs, one per stored row."""
+        lengths = [len(idx) for idx, _ in rows]
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.intp)
+        indices = np.concatenate([np.asarray(idx, dtype=np.intp) for idx, _ in rows]) if rows else np.empty(0, dtype=np.intp)
+        data = np.concatenate([np.asarray(w, dtype=dtype) for _, w in rows]) if rows else np.empty(0, dtype=dtype)
+        matrix = sparse.csr_array((data, indices, indptr), shape=(len(rows), len(columns)))
+        return cls(matrix, bar_rows, index, columns)
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.columns)
+
+    @property
+    def nbytes(self):
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes + self.bar_rows.nbytes
+
+    def held_columns(self):
+        """Assets with a nonzero weight on at least one bar."""
+        held = np.zeros(len(self.columns), dtype=bool)
+        used = self.matrix[np.unique(self.bar_rows)] if len(self.bar_rows) else self.matrix[:0]
+        held[used.indices[used.data != 0]] = True
+        return self.columns[held]
+
+    def weights_at(self, position):
+        """Weights of the bar at the given position as a Series over the held assets of that bar."""
+        row = self.matrix[[self.bar_rows[position]]]
+        return pd.Series(row.data, index=self.columns[row.indices], name=self.index[position])
+
+    def to_dense(self, all_columns=False):
+        """
+        Expand to a DataFrame (bars x assets) like a dense backtest's allocations. Only the held
+        assets are included unless all_columns is set.
+        """
+        columns = self.columns if all_columns else self.held_columns()
+        matrix = self.matrix if all_columns else self.matrix[:, self.columns.get_indexer(columns)]
+        return pd.DataFrame(matrix[self.bar_rows].toarray(), index=self.index, columns=columns)
+
+
+def dense_allocations(allocations):
+    """Allocation DataFrame of a backtest result, expanding SparseAllocations on demand."""
+    return allocations.to_dense() if isinstance(allocations, SparseAllocations) else allocations
@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
 
+from covariance import COV_METHODS
+from optimizer import HRP_LINKAGE_METHODS
+
 def get_backtest_settings(available_dates):
     st.sidebar.header("Backtest Settings")
     # Determine the min and max dates from the available_dates index
@@ -44,21 +47,69 @@ def get_backtest_settings(available_dates):
     lookback_days = st.sidebar.number_input("Lookback Period (days) for Reoptimization", min_value=30, value=30, step=1)
     rebalance_days = st.sidebar.number_input("Rebalance Every N Days", min_value=1, value=30, step=1)
     nonnegative_toggle = st.sidebar.checkbox("Constrain MVO to Nonnegative Holdings", value=True)
+    linkage_method = st.sidebar.selectbox("HRP Linkage Method", HRP_LINKAGE_METHODS, index=0)
+    cov_labels = {"sample": "Sample (lookback window)", "ewma": "Exponentially weighted (EWMA)"}
+    cov_method = st.sidebar.selectbox("Covariance Estimator", COV_METHODS, index=0, format_func=cov_labels.get)
+    halflife = None
+    if cov_method == "ewma":
+        halflife = st.sidebar.number_input("EWMA Half-Life (days)", min_value=1, value=30, step=1)
     
-    return start_date, end_date, lookback_days, rebalance_days, nonnegative_toggle
+    return start_date, end_date, lookback_days, rebalance_days, nonnegative_toggle, linkage_method, cov_method, halflife
+
+def get_trading_cost_settings():
+    st.sidebar.header("Trading Costs")
+    drift = st.sidebar.checkbox("Simulate Weight Drift and Trading Costs", value=False)
+    fee_bps = slippage_bps = no_trade_band = 0.0
+    if drift:
+        fee_bps = st.sidebar.number_input("Trading Fee (bps)", min_value=0.0, value=10.0, step=1.0)
+        slippage_bps = st.sidebar.number_input("Slippage (bps)", min_value=0.0, value=5.0, step=1.0)
+        no_trade_band = st.sidebar.number_input("No-Trade Band (% weight)", min_value=0.0, max_value=100.0, value=0.0, step=0.5) / 100
+    return drift, fee_bps, slippage_bps, no_trade_band
+
+def get_bootstrap_settings():
+    st.sidebar.header("Robustness (Bootstrap)")
+    n_paths = st.sidebar.number_input("Bootstrap Paths", min_value=100, max_value=20000, value=1000, step=100)
+    mean_block = st.sidebar.number_input("Mean Block Length (bars)", min_value=1, value=20, step=1)
+    confidence = st.sidebar.slider("Confidence Level", min_value=0.80, max_value=0.99, value=0.95, step=0.01)
+    return n_paths, mean_block, confidence
+
+def get_rolling_metric_settings():
+    st.sidebar.header("Rolling Metrics")
+    windows = st.sidebar.multiselect("Rolling Windows (days)", [7, 30, 90, 180, 365], default=[30])
+    if not windows:
+        st.error("Please select at least one rolling window.")
+        st.stop()
+    return sorted(windows)
+
+def get_universe_settings():
+    dynamic = st.sidebar.checkbox("Dynamic Top-N Universe (all coins)", value=False)
+    top_n = None
+    if dynamic:
+        top_n = int(st.sidebar.number_input("Assets Held per Rebalance (N)", min_value=2, value=20, step=1))
+    return top_n
 
-def get_asset_selection(data):
-    coins = data.columns.tolist()
+def get_asset_selection(coins):
     selected_coins = st.sidebar.multiselect("Select Assets", coins, default=coins[:3])
     if not selected_coins:
         st.error("Please select at least one asset.")
         st.stop()
     return selected_coins
 
-def get_optimization_methods(initial_allocations):
-    available_methods = list(initial_allocations.keys())
+def get_optimization_methods(optimizers):
+    available_methods = list(optimizers.keys())
     selected_methods = st.sidebar.multiselect("Select Optimization Methods", available_methods, default=available_methods)
     if not selected_methods:
         st.error("Please select at least one optimization method.")
         st.stop()
     return selected_methods
+
+def get_sweep_settings(available_methods):
+    st.sidebar.header("Parameter Sweep Settings")
+    lookback_grid = st.sidebar.multiselect("Lookback Periods (days)", [30, 60, 90, 180, 365], default=[30, 60, 90])
+    rebalance_grid = st.sidebar.multiselect("Rebalance Periods (days)", [1, 7, 14, 30, 60, 90], default=[7, 14, 30])
+    sweep_methods = st.sidebar.multiselect("Sweep Optimization Methods", available_methods, default=available_methods)
+    nonnegative_grid = st.sidebar.multiselect("MVO Nonnegative Constraint", [True, False], default=[True])
+    if not lookback_grid or not rebalance_grid or not sweep_methods or not nonnegative_grid:
+        st.error("Please select at least one value for every parameter sweep setting.")
+        st.stop()
+    return sorted(lookback_grid), sorted(rebalance_grid), sweep_methods, nonnegative_grid
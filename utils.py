@@ -1,113 +1,665 @@
 # utils.py
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 import numpy as np
 import pandas as pd
-from optimizer import run_optimizers  # Make sure this function incorporates exponential weighting if desired
+from covariance import make_estimator, window_estimate
+from metrics import rolling_metric_arrays
+from optimizer import run_optimizer
+from profiling import active_profiler, profiling, record_fallback, stage
+from universe import SparseAllocations, listing_rows, top_n_assets
+
+# === Bar Frequency ===
+# Backtests run on bars of any fixed frequency (daily, hourly, 5-minute, ...). Lookback and
+# rebalance periods can be given in bars or as time offsets, and Sharpe ratios are annualized
+# from the bar length.
+ROLLING_SHARPE_WINDOW = pd.Timedelta(days=30)
+
+
+def bar_timedelta(index, freq=None):
+    """
+    Length of one bar: freq (a fixed-length pandas offset alias such as "1D", "1h" or "5min") if given,
+    otherwise the median spacing of the datetime index (one day if it has fewer than two rows).
+    """
+    if freq is not None:
+        return pd.Timedelta(pd.tseries.frequencies.to_offset(freq).nanos, unit="ns")
+    if len(index) < 2:
+        return pd.Timedelta(days=1)
+    return pd.Timedelta(pd.Series(index).diff().median())
+
+
+def periods_per_year(bar):
+    """Number of bars of the given length in a (365-day, crypto) year."""
+    return pd.Timedelta(days=365) / bar
+
+
+def parse_period(period, default_unit):
+    """
+    Parse a lookback or rebalance period into ("bars", n) or ("time", Timedelta).
+
+    Numbers are counted in default_unit ("days" or "bars"), strings ending in "bar"/"bars"
+    are bar counts (e.g. "288 bars"), and other strings or timedeltas are time offsets
+    (e.g. "6h", "90D").
+    """
+    if isinstance(period, str) and period.strip().lower().endswith(("bar", "bars")):
+        unit, value = "bars", int(period.strip().lower().rstrip("s").removesuffix("bar").strip())
+    elif isinstance(period, (int, np.integer, float, np.floating)) and not isinstance(period, bool):
+        if default_unit == "bars":
+            unit, value = "bars", int(period)
+        else:
+            unit, value = "time", pd.Timedelta(**{default_unit: period})
+    else:
+        unit, value = "time", pd.Timedelta(period)
+    if value <= (0 if unit == "bars" else pd.Timedelta(0)):
+        raise ValueError(f"Period must be positive, got {period!r}")
+    return unit, value
+
+
+class BacktestCancelled(Exception):
+    """Raised inside a backtest when its cancel event is set."""
+
 
 # === Dynamic Backtest Function ===
-def dynamic_backtest_portfolio(prices, method, lookback_days, rebalance_days, nonnegative_flag):
+def dynamic_backtest_portfolio(prices, method, lookback_days, rebalance_days, nonnegative_flag, linkage_method="single",
+                               cov_method="sample", halflife=None, cache=None, profile=False, freq=None,
+                               dtype=np.float64, drift=False, fee_bps=0.0, slippage_bps=0.0, no_trade_band=0.0,
+                               top_n=None, eligibility=None, liquidity=None, progress=None, cancel=None):
     """
     Perform a dynamic backtest with periodic reoptimization.
     For each rebalance date, only assets with a positive return standard deviation
     over the lookback window are included in the optimization. The optimizer then assigns
     weights (using equal weight, MVO, or HRP) to the valid assets. Assets with zero std are set to 0.
-    
+
     Parameters:
       prices (DataFrame): Historical price data with datetime index.
       method (str): The optimization method to use (e.g., "HRB", "Mean Variance", "Equal Weight").
-      lookback_days (int): Number of days to look back for reoptimization.
-      rebalance_days (int): Frequency (in days) at which to rebalance the portfolio.
+      lookback_days (int or str): Lookback window for reoptimization: a number of days, a time
+            offset ("36h", "90D") or a bar count ("288 bars").
+      rebalance_days (int or str): Rebalance period: a number of bars (days on daily data), a bar
+            count ("12 bars") or a time offset ("4h", "7D").
       nonnegative_flag (bool): Whether to enforce nonnegative weights in MVO.
-    
+      linkage_method (str): Hierarchical clustering linkage used by HRP ("single", "average", "ward", "complete").
+      cov_method (str): Covariance estimator, "sample" (lookback window, Ledoit-Wolf for MVO) or "ewma".
+      halflife (float): EWMA half-life in days (only used when cov_method is "ewma").
+      cache (OptimizerCache): Optional on-disk cache of optimizer results to reuse earlier solves.
+      profile (bool): Whether to collect per-stage timings, solver statistics and fallback counts.
+      freq (str): Bar frequency as a pandas offset alias ("1D", "1h", "5min"); inferred from the
+            index spacing if None. Used for annualization and the EWMA half-life.
+      dtype: Float type of the return and weight arrays (np.float32 halves their memory).
+      drift (bool): Simulate drifting holdings between rebalances instead of holding the target
+            weights on every bar. Implied by any of the cost or band settings below.
+      fee_bps (float): Proportional trading fee, in basis points of traded value.
+      slippage_bps (float): Proportional slippage, in basis points of traded value.
+      no_trade_band (float): Assets whose weight is within this distance of the target (e.g. 0.02
+            for 2 percentage points) are not traded at a rebalance.
+      top_n (int): Dynamic universe: at each rebalance only the top_n eligible assets are
+            optimized. An asset is eligible if it has real (not backfilled) prices for the whole
+            lookback window and, if given, its eligibility mask is True on the rebalance bar.
+      eligibility (DataFrame): Optional precomputed boolean mask (bars x assets), e.g. built from
+            universe.listing_mask and volume thresholds. Only used with top_n.
+      liquidity (DataFrame): Optional ranking scores (bars x assets, e.g. trailing dollar volume).
+            Without it, assets are ranked by the number of bars their price moved in the
+            lookback window, then by listing date. Only used with top_n.
+      progress (callable): Called as progress(done, total) with the number of rebalance dates
+            processed so far, e.g. to drive a progress bar from another thread.
+      cancel (threading.Event): If set while the backtest runs, BacktestCancelled is raised at
+            the next rebalance date.
+
     Returns:
-      dict: Contains cumulative returns, rolling Sharpe, drawdowns, allocation history,
-            final annualized Sharpe, and maximum drawdown.
-    """
-    import numpy as np
-    import pandas as pd
-
-    # Calculate daily returns and get the dates from the returns index.
-    returns = prices.pct_change().dropna()
-    dates = returns.index
-    weight_df = pd.DataFrame(index=dates, columns=prices.columns)
-
-    for i in range(0, len(dates), rebalance_days):
-        rebal_date = dates[i]
-        lookback_start = rebal_date - pd.Timedelta(days=lookback_days)
-        lookback_data = prices.loc[lookback_start:rebal_date]
-
-        # If the lookback window is empty, fallback to previous weights or equal weights.
-        if lookback_data.empty:
-            end_idx = min(i + rebalance_days, len(dates))
-            if i > 0:
-                weight_df.iloc[i:end_idx] = weight_df.iloc[i - 1].values
-            else:
-                weight_df.iloc[i:end_idx] = pd.Series(1 / len(prices.columns), index=prices.columns).values
+      dict: Contains bar returns, cumulative returns, rolling Sharpe, drawdowns, allocation history,
+            final annualized Sharpe, and maximum drawdown, plus a "profile" summary
+            (see profiling.Profiler.summary) if profile is set. In drift mode the allocation
+            history holds the drifted weights at the start of each bar, and "turnover" and
+            "costs" series (fractions of portfolio value traded and paid on each bar) are added.
+            With top_n the allocation history is a universe.SparseAllocations (see its to_dense).
+    """
+    results = dynamic_backtest_portfolios(prices, [method], lookback_days, rebalance_days, nonnegative_flag,
+                                          linkage_method=linkage_method, cov_method=cov_method, halflife=halflife, cache=cache,
+                                          profile=profile, freq=freq, dtype=dtype, drift=drift, fee_bps=fee_bps,
+                                          slippage_bps=slippage_bps, no_trade_band=no_trade_band, top_n=top_n,
+                                          eligibility=eligibility, liquidity=liquidity, progress=progress, cancel=cancel)
+    return results[method]
+
+
+# === Multi-Method Dynamic Backtest ===
+def dynamic_backtest_portfolios(prices, methods, lookback_days, rebalance_days, nonnegative_flag, linkage_method="single",
+                                cov_method="sample", halflife=None, cache=None, profile=False, freq=None,
+                                dtype=np.float64, drift=False, fee_bps=0.0, slippage_bps=0.0, no_trade_band=0.0,
+                                top_n=None, eligibility=None, liquidity=None, progress=None, cancel=None):
+    """
+    Run the dynamic backtest for several optimization methods in a single pass.
+    The rebalance calendar is walked once and each lookback window is sliced and
+    filtered once, then handed to every selected method. Only the requested
+    methods are solved at each rebalance date.
+
+    Parameters:
+      prices (DataFrame): Historical price data with datetime index.
+      methods (list of str): Optimization methods to backtest (keys of optimizer.OPTIMIZERS).
+      lookback_days (int or str): Lookback window for reoptimization: a number of days, a time
+            offset ("36h", "90D") or a bar count ("288 bars").
+      rebalance_days (int or str): Rebalance period: a number of bars (days on daily data), a bar
+            count ("12 bars") or a time offset ("4h", "7D").
+      nonnegative_flag (bool): Whether to enforce nonnegative weights in MVO.
+      linkage_method (str): Hierarchical clustering linkage used by HRP ("single", "average", "ward", "complete").
+      cov_method (str): Covariance estimator, "sample" (lookback window, Ledoit-Wolf for MVO) or "ewma".
+      halflife (float): EWMA half-life in days (only used when cov_method is "ewma").
+      cache (OptimizerCache): Optional on-disk cache of optimizer results to reuse earlier solves.
+      profile (bool): Whether to collect per-stage timings, solver statistics and fallback counts.
+            The profile covers the single pass shared by all methods and is attached to each
+            method's result as "profile".
+      freq (str): Bar frequency as a pandas offset alias ("1D", "1h", "5min"); inferred from the
+            index spacing if None. Used for annualization and the EWMA half-life.
+      dtype: Float type of the return and weight arrays (np.float32 halves their memory).
+      drift, fee_bps, slippage_bps, no_trade_band: Drift and trading-cost simulation
+            (see dynamic_backtest_portfolio).
+      top_n, eligibility, liquidity: Dynamic top-N universe selection (see dynamic_backtest_portfolio).
+      progress, cancel: Progress callback and cancel event (see dynamic_backtest_portfolio).
+
+    Returns:
+      dict: Maps each method to the result dict described in dynamic_backtest_portfolio.
+    """
+    if min(fee_bps, slippage_bps, no_trade_band) < 0:
+        raise ValueError("fee_bps, slippage_bps and no_trade_band must be nonnegative")
+    trading = {"drift": drift or fee_bps > 0 or slippage_bps > 0 or no_trade_band > 0,
+               "cost_rate": (fee_bps + slippage_bps) / 1e4, "no_trade_band": no_trade_band}
+    if top_n is not None and top_n < 1:
+        raise ValueError(f"top_n must be at least 1, got {top_n!r}")
+    universe = None
+    if top_n is not None:
+        # Align the precomputed masks with the price matrix once, as plain arrays.
+        universe = {
+            "top_n": int(top_n),
+            "eligibility": None if eligibility is None else eligibility.reindex(
+                index=prices.index, columns=prices.columns, fill_value=False).to_numpy(dtype=bool),
+            "liquidity": None if liquidity is None else np.nan_to_num(liquidity.reindex(
+                index=prices.index, columns=prices.columns).to_numpy(dtype=np.float64), nan=-np.inf),
+        }
+    args = (prices, methods, lookback_days, rebalance_days, nonnegative_flag, linkage_method, cov_method, halflife, cache,
+            freq, dtype, trading, universe, progress, cancel)
+    if not profile:
+        return _backtest_pass(*args)
+    with profiling() as profiler:
+        results = _backtest_pass(*args)
+    summary = profiler.summary()
+    for res in results.values():
+        res["profile"] = summary
+    return results
+
+
+def _backtest_pass(prices, methods, lookback_days, rebalance_days, nonnegative_flag, linkage_method, cov_method, halflife,
+                   cache, freq, dtype, trading, universe, progress, cancel):
+    """Single walk over the rebalance calendar for every method (see dynamic_backtest_portfolios)."""
+    profiler = active_profiler()
+    columns = prices.columns
+    n_assets = len(columns)
+    bar = bar_timedelta(prices.index, freq)
+    lookback_unit, lookback = parse_period(lookback_days, "days")
+    rebalance_unit, rebalance = parse_period(rebalance_days, "bars")
+
+    # Compute bar returns once as a contiguous array of the requested dtype. Rows containing any
+    # NaN are dropped, matching prices.pct_change().dropna().
+    with stage("returns"), np.errstate(divide="ignore", invalid="ignore"):
+        price_values = np.ascontiguousarray(prices.to_numpy(dtype=dtype))
+        all_returns = np.divide(price_values[1:], price_values[:-1], dtype=dtype)
+        all_returns -= 1
+        row_valid = ~np.isnan(all_returns).any(axis=1)
+        returns = all_returns if row_valid.all() else np.ascontiguousarray(all_returns[row_valid])
+        del all_returns
+    dates = prices.index[1:][row_valid]
+    # Position of each return row in the price array, and the number of valid return rows
+    # before each price row (maps price-row window bounds to rows of returns).
+    price_positions = np.flatnonzero(row_valid) + 1
+    row_counts = np.concatenate([[0], np.cumsum(row_valid)])
+
+    # Rebalance calendar: every `rebalance` bars, or the first bar at or after each multiple of a
+    # time offset from the first date. Each rebalance holds until the next one.
+    if rebalance_unit == "bars":
+        rebalance_idx = np.arange(0, len(dates), rebalance)
+    elif len(dates):
+        targets = pd.date_range(dates[0], dates[-1], freq=rebalance)
+        rebalance_idx = np.unique(dates.searchsorted(targets, side="left"))
+    else:
+        rebalance_idx = np.empty(0, dtype=np.intp)
+    period_ends = np.append(rebalance_idx[1:], len(dates))
+
+    # Window bounds for all rebalance dates at once: prices rows [start, end] inclusive.
+    window_ends = price_positions[rebalance_idx]
+    if lookback_unit == "bars":
+        window_starts = np.maximum(window_ends - lookback, 0)
+    else:
+        window_starts = prices.index.searchsorted(dates[rebalance_idx] - lookback, side="left")
+    # The same windows as rows of returns: returns[lo:hi].
+    window_los, window_his = row_counts[window_starts], row_counts[window_ends]
+
+    # Sums and sums of squares at the window bounds give every lookback window's std in
+    # O(n_assets), accumulated in float64 without materializing full prefix-sum matrices.
+    with stage("window statistics"):
+        bounds = np.unique(np.concatenate([[0], window_los, window_his, [len(returns)]]))
+        sum_returns = np.zeros((len(bounds), n_assets))
+        sum_squares = np.zeros((len(bounds), n_assets))
+        if len(bounds) > 1:
+            np.cumsum(np.add.reduceat(returns, bounds[:-1], axis=0, dtype=np.float64), axis=0, out=sum_returns[1:])
+            np.cumsum(np.add.reduceat(np.square(returns), bounds[:-1], axis=0, dtype=np.float64), axis=0,
+                      out=sum_squares[1:])
+        lo_pos, hi_pos = bounds.searchsorted(window_los), bounds.searchsorted(window_his)
+        if universe is not None and universe["liquidity"] is None:
+            # Number of bars each asset's price moved, the default ranking of the dynamic universe.
+            sum_moves = np.zeros((len(bounds), n_assets))
+            if len(bounds) > 1:
+                np.cumsum(np.add.reduceat(returns != 0, bounds[:-1], axis=0, dtype=np.float64), axis=0, out=sum_moves[1:])
+
+    if universe is not None:
+        # Price row of each asset's first real (not backfilled) price.
+        listed_rows = listing_rows(price_values)
+
+    # Covariance estimator shared by HRP and MVO. The sample estimator is slid from one lookback
+    # window to the next; the EWMA estimator is fed every bar once and keeps its own memory
+    # (its half-life is given in days and converted to bars).
+    # With a dynamic universe the sample estimate is computed on the selected assets' window
+    # columns only, so no O(n_assets²) running sums are slid for the whole universe; the EWMA
+    # estimator still runs over every asset, since its memory spans the whole history.
+    halflife_bars = halflife * (pd.Timedelta(days=1) / bar) if halflife is not None else None
+    estimator = make_estimator(n_assets, cov_method, halflife_bars) if universe is None or cov_method == "ewma" else None
+    fed_lo = fed_hi = 0
+
+    optimize = cache.run_optimizer if cache is not None else run_optimizer
+    equal_weights = np.full(n_assets, 1 / n_assets)
+    if universe is None:
+        weights = {method: np.zeros((len(dates), n_assets), dtype=dtype) for method in methods}
+    else:
+        # Target weights per rebalance as (asset positions, weights), instead of dates x assets.
+        targets = {method: [] for method in methods}
+    # Rebalances where a method kept its previous weights; in drift mode these are not traded.
+    holds = {method: np.zeros(len(rebalance_idx), dtype=bool) for method in methods}
+
+    for k, i in enumerate(rebalance_idx):
+        if cancel is not None and cancel.is_set():
+            raise BacktestCancelled(f"Backtest cancelled after {k} of {len(rebalance_idx)} rebalance dates")
+        if progress is not None:
+            progress(k, len(rebalance_idx))
+        rebalance_started = time.perf_counter() if profiler is not None else None
+        start, end, end_idx = window_starts[k], window_ends[k], period_ends[k]
+        lo, hi = window_los[k], window_his[k]
+
+        # Window returns are returns[lo:hi], i.e. prices rows start..end.
+        n_obs = hi - lo
+        valid_idx = np.empty(0, dtype=np.intp)
+        if n_obs > 1:
+            window_sum = sum_returns[hi_pos[k]] - sum_returns[lo_pos[k]]
+            window_var = (sum_squares[hi_pos[k]] - sum_squares[lo_pos[k]] - window_sum ** 2 / n_obs) / (n_obs - 1)
+            # Only include assets whose return std > 0.
+            valid_idx = np.flatnonzero(window_var > 0)
+
+        if universe is not None:
+            with stage("universe selection"):
+                top_n = universe["top_n"]
+                if universe["liquidity"] is not None:
+                    scores = universe["liquidity"][end]
+                else:
+                    scores = sum_moves[hi_pos[k]] - sum_moves[lo_pos[k]]
+                # Top N of the assets listed for the whole window and eligible on the rebalance bar.
+                candidates = valid_idx[listed_rows[valid_idx] <= start]
+                if universe["eligibility"] is not None:
+                    candidates = candidates[universe["eligibility"][end, candidates]]
+                valid_idx = top_n_assets(candidates, top_n, scores, listed_rows)
+                if k == 0:
+                    # Equal-weight fallback: the top N assets listed by the first rebalance (cash if none are).
+                    listed = np.flatnonzero(listed_rows <= end)
+                    if universe["eligibility"] is not None:
+                        listed = listed[universe["eligibility"][end, listed]]
+                    fallback_idx = top_n_assets(listed, top_n, scores, listed_rows)
+                    universe_fallback = (fallback_idx, np.full(len(fallback_idx), 1 / max(len(fallback_idx), 1), dtype=dtype))
+
+        # If the window is empty or no assets are valid, fallback to previous weights or equal weights.
+        if len(valid_idx) == 0:
+            record_fallback("backtest: no assets with varying prices in the window")
+            for method in methods:
+                if universe is None:
+                    weights[method][i:end_idx] = weights[method][i - 1] if i > 0 else equal_weights
+                else:
+                    targets[method].append(targets[method][-1] if k > 0 else universe_fallback)
+                holds[method][k] = i > 0
             continue
 
-        # Compute lookback returns and calculate standard deviation per asset.
-        lookback_returns = lookback_data.pct_change().dropna()
-        asset_stds = lookback_returns.std()
-        # Only include assets whose return std > 0.
-        valid_assets = asset_stds[asset_stds > 0].index.tolist()
-
-        # If no assets are valid, fallback to previous weights or equal weights.
-        if len(valid_assets) == 0:
-            end_idx = min(i + rebalance_days, len(dates))
-            if i > 0:
-                weight_df.iloc[i:end_idx] = weight_df.iloc[i - 1].values
+        with stage("covariance"):
+            if cov_method == "ewma":
+                # Feed the bars since the last rebalance into the recursive EWMA estimate.
+                estimator.add(returns[fed_hi:hi])
+                fed_hi = hi
+            elif universe is None:
+                # Slide the covariance window to returns[lo:hi], updating only the rows that
+                # entered or left (a full refill if the windows don't overlap).
+                if lo >= fed_hi or lo < fed_lo:
+                    estimator.reset()
+                    fed_lo = fed_hi = lo
+                estimator.remove(returns[fed_lo:lo])
+                estimator.add(returns[fed_hi:hi])
+                fed_lo, fed_hi = lo, hi
+            if estimator is not None:
+                estimate = estimator.estimate(valid_idx)
             else:
-                weight_df.iloc[i:end_idx] = pd.Series(1 / len(prices.columns), index=prices.columns).values
-            continue
+                estimate = window_estimate(returns[lo:hi, valid_idx], cov_method)
 
-        # Filter the lookback data to only include valid assets.
-        filtered_lookback_data = lookback_data[valid_assets]
+        # Filter the lookback data to only include valid assets (a view when all assets are valid).
+        with stage("window slicing"):
+            valid_columns = columns[valid_idx]
+            window_values = price_values[start:end + 1]
+            if len(valid_idx) < n_assets:
+                window_values = window_values[:, valid_idx]
+            filtered_lookback_data = pd.DataFrame(
+                window_values,
+                index=prices.index[start:end + 1],
+                columns=valid_columns,
+                copy=False,
+            )
 
-        # Run the optimizer on the filtered data.
-        dynamic_allocations = run_optimizers(filtered_lookback_data, nonnegative_mvo=nonnegative_flag)
-        new_weights = dynamic_allocations[method]
-        # Reindex new_weights to the full set of assets (assets not in valid_assets get weight 0).
-        new_weights = new_weights.reindex(prices.columns).fillna(0)
+        for method in methods:
+            # Run only the requested optimizer on the shared, filtered window.
+            with stage(f"optimize: {method}"):
+                method_weights = optimize(filtered_lookback_data, method, nonnegative_mvo=nonnegative_flag,
+                                          linkage_method=linkage_method, cov_method=cov_method, halflife=halflife,
+                                          halflife_bars=halflife_bars, estimate=estimate)
+            valid_weights = np.nan_to_num(method_weights.reindex(valid_columns).to_numpy(dtype=np.float64), nan=0.0)
+            if universe is not None:
+                # Only the selected assets are stored; normalize as below.
+                total = valid_weights.sum()
+                if total > 0:
+                    targets[method].append((valid_idx, (valid_weights / total).astype(dtype)))
+                else:
+                    record_fallback(f"backtest: {method} returned no positive weights")
+                    targets[method].append(targets[method][-1] if k > 0 else universe_fallback)
+                    holds[method][k] = i > 0
+                continue
 
-        # Normalize weights if the sum is > 0.
-        if new_weights.sum() > 0:
-            new_weights /= new_weights.sum()
+            # Assets not in valid_assets get weight 0.
+            weight_matrix = weights[method]
+            new_weights = np.zeros(n_assets)
+            new_weights[valid_idx] = valid_weights
+
+            # Normalize weights if the sum is > 0.
+            total = new_weights.sum()
+            if total > 0:
+                new_weights /= total
+            else:
+                # Fallback to previous weights, or equal weights if not available
+                record_fallback(f"backtest: {method} returned no positive weights")
+                new_weights = weight_matrix[i - 1] if i > 0 else equal_weights
+                holds[method][k] = i > 0
+
+            # Apply these new weights for the period until the next rebalance.
+            weight_matrix[i:end_idx] = new_weights
+
+        if profiler is not None:
+            profiler.add_rebalance(dates[i], time.perf_counter() - rebalance_started)
+
+    if progress is not None:
+        progress(len(rebalance_idx), len(rebalance_idx))
+
+    annualization = periods_per_year(bar)
+    rolling_window = max(int(round(ROLLING_SHARPE_WINDOW / bar)), 2)
+    results = {}
+    for method in methods:
+        if universe is not None:
+            if trading["drift"]:
+                with stage("drift simulation"):
+                    portfolio_returns, turnover, costs, bar_weights = _simulate_sparse_drift(
+                        returns, targets[method], rebalance_idx, period_ends, holds[method],
+                        trading["cost_rate"], trading["no_trade_band"])
+                allocations = SparseAllocations.from_rows(bar_weights, np.arange(len(dates)), dates, columns, dtype)
+            else:
+                portfolio_returns = np.zeros(len(dates))
+                for (idx, target), i, end in zip(targets[method], rebalance_idx, period_ends):
+                    portfolio_returns[i:end] = np.dot(returns[i:end, idx], target.astype(np.float64))
+                allocations = SparseAllocations.from_rows(
+                    targets[method], np.repeat(np.arange(len(rebalance_idx)), period_ends - rebalance_idx), dates,
+                    columns, dtype)
         else:
-            # Fallback to previous weights, or equal weights if not available
-            if i > 0:
-                new_weights = weight_df.iloc[i - 1]
+            weight_matrix = weights[method]
+            if trading["drift"]:
+                with stage("drift simulation"):
+                    portfolio_returns, turnover, costs = _simulate_drift(
+                        returns, weight_matrix, rebalance_idx, period_ends, holds[method],
+                        trading["cost_rate"], trading["no_trade_band"])
             else:
-                new_weights = pd.Series(1 / len(prices.columns), index=prices.columns)
+                portfolio_returns = np.einsum("ij,ij->i", returns, weight_matrix, dtype=np.float64)
+            allocations = pd.DataFrame(weight_matrix, index=dates, columns=columns)
+        with stage("metrics"):
+            results[method] = _backtest_metrics(portfolio_returns, allocations, dates, annualization, rolling_window)
+        if trading["drift"]:
+            results[method]["turnover"] = pd.Series(turnover, index=dates)
+            results[method]["costs"] = pd.Series(costs, index=dates)
+    return results
+
+
+# === Drift and Trading Costs ===
+def _apply_no_trade_band(target, current, band):
+    """
+    Post-trade weights when assets within band of their target are left untouched. The traded
+    assets are scaled so the weights still sum to one. The initial allocation out of cash
+    always trades to the target.
+    """
+    if band <= 0 or not current.any():
+        return target
+    trade = np.abs(target - current) > band
+    if not trade.any():
+        return current
+    if trade.all():
+        return target
+    post = current.copy()
+    traded_target = target[trade].sum()
+    if traded_target > 0:
+        post[trade] = target[trade] * (1 - current[~trade].sum()) / traded_target
+    else:
+        post[trade] = 0.0
+        post /= post.sum()
+    return post
+
+
+def _simulate_drift(returns, weights, rebalance_idx, period_ends, holds, cost_rate, band):
+    """
+    Simulate holdings that drift with asset returns between rebalances.
+
+    At each rebalance the drifted weights are traded to the target (subject to the no-trade
+    band, and not at all where holds is set), paying cost_rate per unit of turnover out of
+    portfolio value. Within a holding period the per-asset growth is a vectorized cumulative
+    product, so there is one NumPy step per rebalance and no loop over bars. weights holds the
+    target weights on entry and is overwritten with the drifted start-of-bar weights.
+
+    Returns (portfolio returns, turnover, costs), each one value per bar.
+    """
+    n_bars, n_assets = weights.shape
+    portfolio_returns = np.zeros(n_bars)
+    turnover = np.zeros(n_bars)
+    costs = np.zeros(n_bars)
+    current = np.zeros(n_assets)  # start from cash
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i, end, hold in zip(rebalance_idx, period_ends, holds):
+            if i >= end:
+                continue
+            target = weights[i].astype(np.float64)
+            post = current if hold else _apply_no_trade_band(target, current, band)
+            turnover[i] = np.abs(post - current).sum()
+            costs[i] = cost_rate * turnover[i]
+            portfolio_returns[i:end], weights[i:end], current = _drift_period(post, returns[i:end], costs[i])
+    return portfolio_returns, turnover, costs
+
+
+def _simulate_sparse_drift(returns, targets, rebalance_idx, period_ends, holds, cost_rate, band):
+    """
+    _simulate_drift for a dynamic universe, with one (asset positions, weights) target per
+    rebalance. Each period is simulated on the union of the current holdings and the target
+    only. Returns (portfolio returns, turnover, costs, drifted start-of-bar weights as one
+    (asset positions, weights) pair per bar).
+    """
+    n_bars = len(returns)
+    portfolio_returns = np.zeros(n_bars)
+    turnover = np.zeros(n_bars)
+    costs = np.zeros(n_bars)
+    bar_weights = []
+    held_idx, current = np.empty(0, dtype=np.intp), np.empty(0)  # start from cash
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for (target_idx, target_weights), i, end, hold in zip(targets, rebalance_idx, period_ends, holds):
+            if i >= end:
+                continue
+            active = np.union1d(held_idx, target_idx)
+            held = np.zeros(len(active))
+            held[np.searchsorted(active, held_idx)] = current
+            target = np.zeros(len(active))
+            target[np.searchsorted(active, target_idx)] = target_weights
+            post = held if hold else _apply_no_trade_band(target, held, band)
+            turnover[i] = np.abs(post - held).sum()
+            costs[i] = cost_rate * turnover[i]
+
+            # Assets sold out of are dropped before drifting the rest.
+            keep = post != 0
+            active, post = active[keep], post[keep]
+            portfolio_returns[i:end], period_weights, current = _drift_period(post, returns[i:end, active], costs[i])
+            bar_weights.extend((active, row) for row in period_weights)
+            held_idx = active
+    return portfolio_returns, turnover, costs, bar_weights
 
 
-        # Apply these new weights for the period until the next rebalance.
-        end_idx = min(i + rebalance_days, len(dates))
-        weight_df.iloc[i:end_idx] = new_weights.values
+def _drift_period(post, period_returns, cost):
+    """
+    Drift post-trade weights through one holding period. Returns the bar returns (the first
+    net of the rebalance cost), the start-of-bar weights and the weights at the end of the period.
+    A book with nothing invested stays in cash: zero returns after the cost, and zero weights.
+    """
+    if not post.any():
+        bar_returns = np.zeros(len(period_returns))
+        bar_returns[0] = -cost
+        return bar_returns, np.zeros((len(period_returns), len(post))), post
+    # Value of each holding at the end of every bar in the period, per unit invested.
+    values = post * np.cumprod(1 + period_returns, axis=0, dtype=np.float64)
+    totals = values.sum(axis=1)
+    previous = np.concatenate([[post.sum()], totals[:-1]])
+    bar_returns = totals / previous - 1
+    bar_returns[0] = (1 - cost) * totals[0] - 1
+    start_weights = np.vstack([post, values[:-1] / totals[:-1, None]])
+    return bar_returns, start_weights, values[-1] / totals[-1]
+
 
-    # Forward-fill any missing weights.
-    weight_df = weight_df.ffill().fillna(0)
-    portfolio_returns = (returns * weight_df).sum(axis=1)
-    cumulative = (1 + portfolio_returns).cumprod()
+def _backtest_metrics(portfolio_returns, allocations, dates, periods_per_year=365, rolling_window=30):
+    """
+    Compute summary metrics for one portfolio return series and its allocation history
+    (a DataFrame, or SparseAllocations for a dynamic universe).
+    Sharpe ratios are annualized with periods_per_year bars per year, and the rolling Sharpe
+    uses a window of rolling_window bars.
+    """
+    cumulative = np.cumprod(1 + portfolio_returns)
 
-    # Compute rolling annualized Sharpe (30-day window).
-    rolling_sharpe = portfolio_returns.rolling(30).mean() / portfolio_returns.rolling(30).std()
-    rolling_sharpe = np.sqrt(365) * rolling_sharpe
+    # Compute rolling annualized Sharpe with the shared rolling-metrics engine.
+    rolling_sharpe = rolling_metric_arrays(portfolio_returns, [rolling_window], ["sharpe"], periods_per_year)[
+        ("sharpe", rolling_window)][:, 0]
 
     # Compute rolling maximum drawdown.
-    rolling_max = cumulative.cummax()
-    drawdowns = cumulative / rolling_max - 1
-    max_drawdown = drawdowns.min()
+    drawdowns = cumulative / np.maximum.accumulate(cumulative) - 1 if len(cumulative) else cumulative
+    max_drawdown = drawdowns.min() if len(drawdowns) else np.nan
 
     # Calculate overall annualized Sharpe.
-    daily_mean = portfolio_returns.mean()
-    daily_std = portfolio_returns.std()
-    total_sharpe = np.sqrt(365) * (daily_mean / daily_std) if daily_std > 0 else np.nan
+    bar_mean = portfolio_returns.mean() if len(portfolio_returns) else np.nan
+    bar_std = portfolio_returns.std(ddof=1) if len(portfolio_returns) > 1 else np.nan
+    total_sharpe = np.sqrt(periods_per_year) * (bar_mean / bar_std) if bar_std > 0 else np.nan
 
     return {
-        "cumulative": cumulative,
-        "rolling_sharpe": rolling_sharpe,
-        "drawdowns": drawdowns,
-        "allocations": weight_df,
+        "returns": pd.Series(portfolio_returns, index=dates),
+        "cumulative": pd.Series(cumulative, index=dates),
+        "rolling_sharpe": pd.Series(rolling_sharpe, index=dates),
+        "drawdowns": pd.Series(drawdowns, index=dates),
+        "allocations": allocations,
         "sharpe": total_sharpe,
         "drawdown": max_drawdown
     }
 
+
+# === Parameter Sweep ===
+# Per-process handle on the shared price matrix, set up once by _init_sweep_worker.
+_sweep_shm = None
+_sweep_prices = None
+
+
+def _init_sweep_worker(shm_name, shape, index, columns):
+    """Attach a worker process to the shared price matrix without copying it."""
+    global _sweep_shm, _sweep_prices
+    _sweep_shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray(shape, dtype=np.float64, buffer=_sweep_shm.buf)
+    _sweep_prices = pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
+def _run_sweep_task(lookback_days, rebalance_days, nonnegative_flag, methods, options):
+    results = dynamic_backtest_portfolios(_sweep_prices, methods, lookback_days, rebalance_days, nonnegative_flag, **options)
+    return [
+        {
+            "lookback_days": lookback_days,
+            "rebalance_days": rebalance_days,
+            "nonnegative": nonnegative_flag,
+            "method": method,
+            "sharpe": res["sharpe"],
+            "max_drawdown": res["drawdown"],
+        }
+        for method, res in results.items()
+    ]
+
+
+def _grid_value(period):
+    """Sweep grid entries are day/bar counts or period strings (see parse_period)."""
+    return period if isinstance(period, str) else int(period)
+
+
+def sweep_backtests(prices, lookback_grid, rebalance_grid, methods, nonnegative_grid=(True,), linkage_method="single",
+                    cov_method="sample", halflife=None, max_workers=None, freq=None, dtype=np.float64, drift=False,
+                    fee_bps=0.0, slippage_bps=0.0, no_trade_band=0.0, top_n=None):
+    """
+    Run the dynamic backtest over every combination of lookback window, rebalance period
+    and nonnegative flag, spreading the runs across a process pool. The price matrix is
+    placed in shared memory once and attached by each worker instead of being pickled per task.
+    All methods of one configuration are computed in a single backtest pass.
+
+    Parameters:
+      prices (DataFrame): Historical price data with datetime index.
+      lookback_grid (list of int or str): Lookback windows (days, or periods as in dynamic_backtest_portfolios) to test.
+      rebalance_grid (list of int or str): Rebalance periods (bars, or periods as in dynamic_backtest_portfolios) to test.
+      methods (list of str): Optimization methods to backtest.
+      nonnegative_grid (list of bool): Values of the MVO nonnegative flag to test.
+      linkage_method (str): Hierarchical clustering linkage used by HRP.
+      cov_method (str): Covariance estimator, "sample" or "ewma".
+      halflife (float): EWMA half-life in days (only used when cov_method is "ewma").
+      max_workers (int): Number of worker processes (defaults to the CPU count).
+      freq (str): Bar frequency as a pandas offset alias (inferred from the index if None).
+      dtype: Float type of the backtests' return and weight arrays.
+      drift, fee_bps, slippage_bps, no_trade_band: Drift and trading-cost simulation
+            (see dynamic_backtest_portfolio).
+      top_n (int): Dynamic top-N universe size (see dynamic_backtest_portfolio).
+
+    Returns:
+      DataFrame: One row per configuration and method with Sharpe and max drawdown.
+    """
+    values = np.ascontiguousarray(prices.to_numpy(dtype=np.float64))
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        configs = list(itertools.product(lookback_grid, rebalance_grid, nonnegative_grid))
+        options = {"linkage_method": linkage_method, "cov_method": cov_method, "halflife": halflife, "freq": freq,
+                   "dtype": dtype, "drift": drift, "fee_bps": fee_bps, "slippage_bps": slippage_bps,
+                   "no_trade_band": no_trade_band, "top_n": top_n}
+        rows = []
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_sweep_worker,
+            initargs=(shm.name, values.shape, prices.index, prices.columns),
+        ) as executor:
+            futures = [
+                executor.submit(_run_sweep_task, _grid_value(lookback), _grid_value(rebalance), bool(nonnegative),
+                                list(methods), options)
+                for lookback, rebalance, nonnegative in configs
+            ]
+            for future in futures:
+                rows.extend(future.result())
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return pd.DataFrame(rows, columns=["lookback_days", "rebalance_days", "nonnegative", "method", "sharpe", "max_drawdown"])